@@ -0,0 +1,168 @@
+"""
+Rotating log of the console output of S2E.
+
+The output of an analysis is streamed to disk while S2E runs, in segments of
+at most `S2E_LOG_SEGMENT_SIZE` bytes of which only the `S2E_LOG_SEGMENTS` most
+recent are kept. Each segment is named after the offset of its first byte in
+the whole output, so the output can be tailed from any offset while it is
+rotated, without keeping it in memory.
+"""
+
+from __future__ import print_function
+
+import os
+import re
+
+import s2e_web.S2E_settings as settings
+
+
+# Directory of the console logs in a project
+LOG_DIR_NAME = 'logs'
+
+_SEGMENT_FORMAT = 'console.%016d.log'
+_SEGMENT_RE = re.compile(r'^console\.(\d{16})\.log$')
+
+
+def console_log_dir(project_name, s2e_num):
+    """
+    Returns the directory of the console log of an analysis.
+    """
+    return os.path.join(settings.S2E_PROJECT_FOLDER_PATH, project_name, LOG_DIR_NAME, 's2e-out-%d' % s2e_num)
+
+
+def list_segments(log_dir):
+    """
+    Returns the `(start offset, path)` of the segments of a log, oldest first.
+    """
+    try:
+        names = os.listdir(log_dir)
+    except OSError:
+        return []
+
+    segments = []
+    for name in names:
+        m = _SEGMENT_RE.match(name)
+        if m:
+            segments.append((int(m.group(1)), os.path.join(log_dir, name)))
+
+    return sorted(segments)
+
+
+class ConsoleLogWriter(object):
+    """
+    Writes the output of a process to the rotating segments of a log.
+    """
+
+    def __init__(self, log_dir, segment_size=None, max_segments=None):
+        self.log_dir = log_dir
+        self.segment_size = segment_size or settings.S2E_LOG_SEGMENT_SIZE
+        self.max_segments = max_segments or settings.S2E_LOG_SEGMENTS
+        self.offset = 0
+        self._segment = None
+        self._segment_written = 0
+
+        if not os.path.isdir(log_dir):
+            os.makedirs(log_dir)
+
+    def _rotate(self):
+        if self._segment:
+            self._segment.close()
+
+        self._segment = open(os.path.join(self.log_dir, _SEGMENT_FORMAT % self.offset), 'wb')
+        self._segment_written = 0
+
+        for _, path in list_segments(self.log_dir)[:-self.max_segments]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def write(self, data):
+        """
+        Appends data to the log, starting new segments as the current one is full.
+        """
+        while data:
+            if not self._segment or self._segment_written >= self.segment_size:
+                self._rotate()
+
+            chunk = data[:self.segment_size - self._segment_written]
+            self._segment.write(chunk)
+            # Flushed right away, so that the log can be tailed while the process runs
+            self._segment.flush()
+
+            self._segment_written += len(chunk)
+            self.offset += len(chunk)
+            data = data[len(chunk):]
+
+    def close(self):
+        if self._segment:
+            self._segment.close()
+            self._segment = None
+
+
+def stream_to_log(fd, log_dir, chunk_size):
+    """
+    Copies the data read from a file descriptor to a console log until the end of file. At most
+    `chunk_size` bytes are held in memory. The data is discarded if there is no log directory.
+    """
+    writer = ConsoleLogWriter(log_dir) if log_dir else None
+
+    try:
+        while True:
+            data = os.read(fd, chunk_size)
+            if not data:
+                break
+            if writer:
+                writer.write(data)
+    except (IOError, OSError) as err:
+        print('WARN: Failed to write the console log to %s: %s' % (log_dir, err))
+        # Keep reading so that the process never blocks on a full pipe
+        while os.read(fd, chunk_size):
+            pass
+    finally:
+        if writer:
+            writer.close()
+
+
+def read_log(log_dir, offset, max_size=None):
+    """
+    Reads at most `max_size` bytes of a console log from the given offset.
+
+    Returns the data, the offset it starts at and the offset to read from
+    next. The data starts after the given offset if the output before it was
+    rotated away.
+    """
+    max_size = max_size or settings.S2E_LOG_TAIL_MAX_SIZE
+    segments = list_segments(log_dir)
+    if not segments:
+        return b'', offset, offset
+
+    offset = max(offset, segments[0][0])
+    start_offset = None
+    data = []
+    size = 0
+
+    for i, (segment_start, path) in enumerate(segments):
+        segment_end = segments[i + 1][0] if i + 1 < len(segments) else None
+        if (segment_end is not None and segment_end <= offset) or size >= max_size:
+            continue
+
+        try:
+            with open(path, 'rb') as segment:
+                segment.seek(max(offset - segment_start, 0))
+                chunk = segment.read(max_size - size)
+        except (IOError, OSError):
+            # The segment was rotated away in the meantime
+            continue
+
+        if start_offset is None:
+            start_offset = max(offset, segment_start)
+
+        data.append(chunk)
+        size += len(chunk)
+        offset = max(offset, segment_start) + len(chunk)
+
+    if start_offset is None:
+        return b'', offset, offset
+
+    return b''.join(data), start_offset, start_offset + size
@@ -0,0 +1,169 @@
+"""
+Cumulative coverage of all the analyses of a binary.
+
+The coverage of every analysis (see `run_coverage`) is merged, once, into a
+running total stored under the SHA-256 checksum of the analyzed binary. When
+a run is merged, the coverage it adds to the earlier runs is saved in its
+`s2e-out-N` directory, so that neither view needs to reread the coverage of
+the past runs.
+
+The merged runs are identified by the primary key of their `Analysis` entry,
+since the analysis numbers of the deleted analyses are reused. Deleting an
+analysis rebuilds the total from the remaining runs.
+"""
+
+from __future__ import print_function
+
+import contextlib
+import fcntl
+import json
+import os
+
+from configure_and_run_analysis.run_coverage import RunCoverage
+
+
+# Coverage of a run that none of the runs merged before it has
+NEW_COVERAGE_FILE_NAME = 'coverage_new.runs'
+
+# Bump whenever the layout of the list of merged runs changes
+MANIFEST_VERSION = 2
+
+
+class CumulativeCoverage(object):
+    """
+    Running total of the coverage of the analyses of a binary.
+    """
+
+    def __init__(self, binary_checksum, coverage_dir):
+        self.binary_checksum = binary_checksum
+        self.coverage_dir = coverage_dir
+
+    def _path(self, extension):
+        return os.path.join(self.coverage_dir, '%s.%s' % (self.binary_checksum, extension))
+
+    def _load_merged_runs(self):
+        """
+        Returns the ids of the merged runs, or None if the list is missing or
+        has an older layout, in which case the total is not valid either.
+        """
+        try:
+            with open(self._path('json'), 'r') as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+            return None
+
+        return manifest['runs']
+
+    def _save_merged_runs(self, runs):
+        path = self._path('json')
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'runs': runs}, f)
+        os.rename(tmp_path, path)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """
+        Serializes the concurrent updates of the total.
+        """
+        if not os.path.isdir(self.coverage_dir):
+            os.makedirs(self.coverage_dir)
+
+        with open(self._path('lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def load(self):
+        """
+        Returns the cumulative coverage, or `None` if no run was merged.
+        """
+        if not self._load_merged_runs():
+            return None
+
+        return RunCoverage.load(self.coverage_dir, '%s.runs' % self.binary_checksum)
+
+    def merged_runs(self):
+        """
+        Returns the `Analysis` ids of the merged runs, in merge order.
+        """
+        return self._load_merged_runs() or []
+
+    def _merge(self, total, analysis_id, s2e_output_dir, merged_runs):
+        """
+        Merges the coverage of a run into `total` and saves the coverage it
+        adds in its output directory. Returns the new total, or `total` if
+        the run has no coverage.
+        """
+        run_coverage = RunCoverage.load(s2e_output_dir)
+        if run_coverage is None:
+            return total
+
+        if total is None:
+            new_coverage = run_coverage
+            total = run_coverage
+        else:
+            new_coverage = run_coverage.difference(total)
+            total = total.union(run_coverage)
+
+        new_coverage.save(s2e_output_dir, NEW_COVERAGE_FILE_NAME)
+        merged_runs.append(analysis_id)
+
+        return total
+
+    def _save(self, total, merged_runs):
+        if total is None:
+            for extension in ('runs', 'json'):
+                if os.path.exists(self._path(extension)):
+                    os.remove(self._path(extension))
+            return
+
+        total.save(self.coverage_dir, '%s.runs' % self.binary_checksum)
+        self._save_merged_runs(merged_runs)
+
+    def merge_run(self, analysis_id, s2e_output_dir):
+        """
+        Merges the coverage of a run into the total, unless it was already
+        merged, and saves the coverage it adds to the earlier runs in its
+        output directory.
+
+        Returns the coverage that the run adds, or `None` if the run has no
+        coverage.
+        """
+        if RunCoverage.load(s2e_output_dir) is None:
+            return None
+
+        with self._lock():
+            merged_runs = self._load_merged_runs()
+            if merged_runs is not None and analysis_id in merged_runs:
+                return RunCoverage.load(s2e_output_dir, NEW_COVERAGE_FILE_NAME)
+
+            if merged_runs is None:
+                merged_runs = []
+                total = None
+            else:
+                total = self.load()
+
+            total = self._merge(total, analysis_id, s2e_output_dir, merged_runs)
+            self._save(total, merged_runs)
+
+        return RunCoverage.load(s2e_output_dir, NEW_COVERAGE_FILE_NAME)
+
+    def rebuild(self, runs):
+        """
+        Rebuilds the total, and the coverage each run adds, from the given
+        `(analysis id, output directory)` runs. The runs that were merged
+        before keep their order, the others are merged after them.
+        """
+        with self._lock():
+            order = dict((analysis_id, i) for i, analysis_id in enumerate(self.merged_runs()))
+            runs = sorted(runs, key=lambda run: (order.get(run[0], len(order)), run[0]))
+
+            merged_runs = []
+            total = None
+            for analysis_id, s2e_output_dir in runs:
+                total = self._merge(total, analysis_id, s2e_output_dir, merged_runs)
+
+            self._save(total, merged_runs)
@@ -10,14 +10,21 @@ pip install r2pipe pydot
 
 from __future__ import print_function
 
+import bisect
 import glob
 import json
+import multiprocessing
 import os
 
 import pydot
 import r2pipe
 import s2e_web.S2E_settings as S2E_settings
 
+from configure_and_run_analysis import utils
+from configure_and_run_analysis.r2_cache import R2AnalysisCache
+from configure_and_run_analysis.run_coverage import RunCoverage
+from configure_and_run_analysis.tb_coverage import merge_tbs, read_module_tbs, unique_tbs
+
 
 def function_addrs(r2):
     """
@@ -27,98 +34,277 @@ def function_addrs(r2):
         yield int(addr, 16)
 
 
+# Number of functions extracted per radare2 round-trip
+FUNCTION_BATCH_SIZE = 64
+
+# Echoed by radare2 between the outputs of the commands of a batch
+_BATCH_SEPARATOR = 'S2E_GUI_BATCH_SEPARATOR'
+
+
+def _run_batch(r2, commands):
+    """
+    Runs the given commands in a single radare2 round-trip and returns their
+    outputs.
+    """
+    output = r2.cmd(';'.join('%s;?e %s' % (command, _BATCH_SEPARATOR) for command in commands))
+    outputs = output.split('%s\n' % _BATCH_SEPARATOR)
+
+    return outputs[:len(commands)]
+
+
+# Kinds of the control flow edges, as coloured by radare2
+EDGE_TRUE = 'true'
+EDGE_FALSE = 'false'
+EDGE_UNCONDITIONAL = 'unconditional'
+
+
+def block_edges(bb):
+    """
+    Returns the outgoing edges of a basic block of an ``agj`` graph.
+    """
+    if 'jump' not in bb:
+        return []
+
+    if 'fail' not in bb:
+        return [[bb['offset'], bb['jump'], EDGE_UNCONDITIONAL]]
+
+    return [[bb['offset'], bb['jump'], EDGE_TRUE], [bb['offset'], bb['fail'], EDGE_FALSE]]
+
+
+def extract_functions(r2, batch_size=FUNCTION_BATCH_SIZE):
+    """
+    Extracts the name, basic blocks and dot graph of all the functions in a
+    single pass, `batch_size` functions at a time.
+
+    Returns a list of dictionaries with the function's `addr`, `name`,
+    `blocks` (as `[start address, size]` pairs), `edges` (as
+    `[source block, target block, kind]` triples, see `block_edges`) and `dot`
+    graph.
+    """
+    addrs = list(function_addrs(r2))
+    functions = []
+
+    for i in range(0, len(addrs), batch_size):
+        batch = addrs[i:i + batch_size]
+        commands = []
+        for func_addr in batch:
+            commands.append('agj 0x%x' % func_addr)
+            commands.append('ag 0x%x' % func_addr)
+        outputs = _run_batch(r2, commands)
+
+        for func_addr, graph, dot_str in zip(batch, outputs[::2], outputs[1::2]):
+            try:
+                graph = json.loads(graph)
+            except ValueError:
+                print('WARN: Failed to parse the graph of the function at 0x%x' % func_addr)
+                continue
+
+            assert len(graph) == 1
+            graph = graph[0]
+
+            functions.append({
+                'addr': func_addr,
+                'name': graph['name'],
+                'blocks': [[bb['offset'], bb['size']] for bb in graph['blocks']],
+                'edges': [edge for bb in graph['blocks'] for edge in block_edges(bb)],
+                'dot': dot_str,
+            })
+
+    return functions
+
+
 def parse_tb_file(path, module):
     """
     Parse a translation block coverage file generated by S2E's
     ``TranslationBlockCoverage`` plugin.
+
+    Returns a flat array of the `start, end, size` of the module's
+    translation blocks.
     """
     with open(path, 'r') as f:
         try:
-            tb_coverage_data = json.load(f)
+            modules, tb_coverage_data = read_module_tbs(f, module)
         except Exception:
             print('WARN: Failed to parse translation block JSON file %s' % path)
             return None
 
-    if not tb_coverage_data:
+    if not modules:
         print('WARN: Translation block JSON file %s is empty' % path)
         return None
 
-    if module not in tb_coverage_data:
+    if tb_coverage_data is None:
         print('WARN: Target %s not found in translation block JSON file %s' %
               (module, path))
         return None
 
-    return tb_coverage_data[module]
+    return tb_coverage_data
+
+
+def _parse_covered_tbs(args):
+    """
+    Parses a `(translation block coverage file, module)` in a worker process.
+
+    Returns the sorted, deduplicated `(start, end)` pairs of the covered TBs.
+    """
+    path, module = args
+    tb_coverage_data = parse_tb_file(path, module)
+    if not tb_coverage_data:
+        return None
+
+    return unique_tbs(tb_coverage_data)
 
 
-def basic_block_coverage(r2, translation_blocks):
+def parse_tb_files(paths, module, processes=None):
+    """
+    Parses the given translation block coverage files in a pool of
+    `processes` workers (one per core by default) and merges their covered
+    TBs.
+
+    Returns a sorted list of the distinct `(start, end)` covered TBs.
+    """
+    tasks = [(path, module) for path in paths]
+    processes = processes or multiprocessing.cpu_count()
+
+    if len(tasks) <= 1 or processes == 1:
+        results = [_parse_covered_tbs(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        try:
+            results = pool.map(_parse_covered_tbs, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    return merge_tbs([tbs for tbs in results if tbs is not None])
+
+
+def tb_boundaries(translation_blocks):
+    """
+    Returns the sorted start and end addresses of the given TBs.
+    """
+    boundaries = []
+    for tb_start_addr, tb_end_addr in translation_blocks:
+        boundaries.append(tb_start_addr)
+        boundaries.append(tb_end_addr)
+    boundaries.sort()
+
+    return boundaries
+
+
+def is_bb_covered(bb_start_addr, bb_end_addr, tb_boundaries_):
+    """
+    Check if a translation block falls within a basic block OR a basic block
+    falls within a translation block, i.e. if the start or the end address of
+    a TB lies in the basic block.
+
+    `tb_boundaries_` are the sorted TB addresses returned by `tb_boundaries`.
+    """
+    i = bisect.bisect_left(tb_boundaries_, bb_start_addr)
+
+    return i < len(tb_boundaries_) and tb_boundaries_[i] <= bb_end_addr
+
+
+def basic_block_coverage(functions, translation_blocks):
     """
     Calculate the basic block coverage based on the covered TBs.
 
     Returns a set of *covered* basic block start addresses
     """
     covered_bbs = set()
+    boundaries = tb_boundaries(translation_blocks)
 
-    for func_addr in function_addrs(r2):
-        graph = r2.cmdj('agj 0x%x' % func_addr)
-        assert len(graph) == 1
-        graph = graph[0]
+    for function in functions:
+        for bb_start_addr, bb_size in function['blocks']:
+            bb_end_addr = bb_start_addr + bb_size
 
-        for tb_start_addr, tb_end_addr in translation_blocks:
-            for bb in graph['blocks']:
-                bb_start_addr = bb['offset']
-                bb_end_addr = bb_start_addr + bb['size']
-
-                # Check if the translation block falls within a basic block OR
-                # a basic block falls within a translation block
-                if (bb_end_addr >= tb_start_addr >= bb_start_addr or
-                        bb_start_addr <= tb_end_addr <= bb_end_addr):
-                    covered_bbs.add(bb_start_addr)
+            if is_bb_covered(bb_start_addr, bb_end_addr, boundaries):
+                covered_bbs.add(bb_start_addr)
 
     return covered_bbs
 
 
-def render_functions(r2, covered_bbs, output_dir):
+# Holds the covered basic blocks of every function in an analysis and the
+# checksum of the binary, whose functions are read from the radare2 cache to
+# render the function graphs on demand
+FUNCTION_GRAPHS_FILE_NAME = 'functions.json'
+
+
+def function_graph_file_name(function):
+    """
+    Returns the name of the SVG graph of the given function.
     """
-    Renders SVG graphs of each of the functions in the program. Basic blocks
-    that were executed by S2E are coloured green.
+    return '%s_0x%x.svg' % (function['name'], function['addr'])
 
-    The resulting SVG images are written to `output_dir`.
+
+def render_function(args):
+    """
+    Renders the SVG graph of a single function, given as a
+    `(function, covered basic block start addresses, output_dir)` tuple.
+    Basic blocks that were executed by S2E are coloured green.
     """
-    for func_addr in function_addrs(r2):
-        # Get the function name
-        func_name = r2.cmdj('agj 0x%x' % func_addr)[0]['name']
+    function, covered_bbs, output_dir = args
+
+    dot = pydot.graph_from_dot_data(function['dot'])
+    if not dot:
+        return
+    else:
+        dot = dot[0]
 
-        dot_str = r2.cmd('ag 0x%x' % func_addr)
-        dot = pydot.graph_from_dot_data(dot_str)
-        if not dot:
+    for node in dot.get_nodes():
+        node_name = node.get_name()
+        try:
+            # XXX This is very hacky - need something more robust
+            if node_name.startswith('"'):
+                node_name = node_name[1:-1]
+            node_addr = int(node_name, 16)
+        except ValueError:
+            # Node name is not a hex string
             continue
-        else:
-            dot = dot[0]
 
-        for node in dot.get_nodes():
-            node_name = node.get_name()
-            try:
-                # XXX This is very hacky - need something more robust
-                if node_name.startswith('"'):
-                    node_name = node_name[1:-1]
-                node_addr = int(node_name, 16)
-            except ValueError:
-                # Node name is not a hex string
-                continue
+        if node_addr in covered_bbs:
+            node.set_fillcolor('darkolivegreen2')
 
-            if node_addr in covered_bbs:
-                node.set_fillcolor('darkolivegreen2')
+    svg_path = os.path.join(output_dir, function_graph_file_name(function))
+    with open(svg_path, 'wb') as f:
+        svg = dot.create_svg()
+        f.write(svg)
 
-        svg_path = os.path.join(output_dir, '%s_0x%x.svg' % (func_name, func_addr))
-        with open(svg_path, 'wb') as f:
-            svg = dot.create_svg()
-            f.write(svg)
 
+def render_functions(functions, covered_bbs, output_dir, processes=None):
+    """
+    Renders SVG graphs of each of the functions in the program, in a pool of
+    `processes` workers (one per core by default).
 
-def generate_graph(s2e_output_dir, s2e_num, project_name):
+    The resulting SVG images are written to `output_dir`.
+    """
+    # Only send each worker the covered blocks of its own function
+    tasks = [(function, set(bb_start_addr for bb_start_addr, _ in function['blocks']
+                            if bb_start_addr in covered_bbs), output_dir)
+             for function in functions]
+
+    processes = processes or multiprocessing.cpu_count()
+    if len(tasks) <= 1 or processes == 1:
+        for task in tasks:
+            render_function(task)
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # Graphviz dominates the rendering time, so the tasks are small enough
+        # to be handed out in chunks
+        for _ in pool.imap_unordered(render_function, tasks, chunksize=8):
+            pass
+    finally:
+        pool.close()
+        pool.join()
+
+
+def generate_graph(s2e_output_dir, s2e_num, project_name, binary_checksum=None):
     """
     Generate the PNG graph for the analysis in the output_dir
+
+    The radare2 analysis of the binary is cached under its SHA-256 checksum,
+    which is computed if `binary_checksum` is not given.
     """
 
     s2e_env_path = S2E_settings.S2E_ENVIRONMENT_FOLDER_PATH
@@ -157,24 +343,122 @@ def generate_graph(s2e_output_dir, s2e_num, project_name):
         return
 
     # Parse the TB coverage files
-    covered_tbs = set()
-    for tb_coverage_file in tb_coverage_files:
-        # XXX A project can have a different name to the target program
-        tb_coverage_data = parse_tb_file(tb_coverage_file, project_name)
-        if not tb_coverage_data:
-            continue
-
-        covered_tbs.update((start, end) for start, end, _ in tb_coverage_data)
-
-    # Open the program in Radare and do the initial analysis
     # XXX A project can have a different name to the target program
-    r2 = r2pipe.open(os.path.join(project_path, project_name))
-    r2.cmd('aaa')
+    covered_tbs = parse_tb_files(tb_coverage_files, project_name, S2E_settings.TB_COVERAGE_PARSE_PROCESSES)
 
-    # Calculate the basic block coverage and render the information as a set
-    # of PNG images for each function
-    covered_bbs = basic_block_coverage(r2, covered_tbs)
-    render_functions(r2, covered_bbs, output_dir)
+    # Radare is only run if the program was not analyzed before
+    # XXX A project can have a different name to the target program
+    binary_path = os.path.join(project_path, project_name)
+    if not binary_checksum:
+        binary_checksum = utils.file_checksum(binary_path)
+    r2_cache = R2AnalysisCache(binary_path, binary_checksum, S2E_settings.R2_ANALYSIS_CACHE_PATH)
+    functions = r2_cache.load()
+    if functions is None:
+        # Open the program in Radare and do the initial analysis
+        r2 = r2pipe.open(binary_path)
+        r2.cmd('aaa')
+        functions = extract_functions(r2)
+        r2.quit()
+        r2_cache.save(functions)
+
+    # Calculate the basic block coverage and store it with the checksum of the
+    # binary, the function graphs are rendered from the radare2 cache the first
+    # time they are viewed
+    covered_bbs = basic_block_coverage(functions, covered_tbs)
+    try:
+        RunCoverage.from_blocks(project_name, covered_tbs, covered_bbs).save(s2e_output_dir)
+    except (IOError, OSError) as err:
+        print('WARN: Failed to write the coverage of %s: %s' % (s2e_output_dir, err))
+    utils.write_string_to_disk_and_close(os.path.join(output_dir, FUNCTION_GRAPHS_FILE_NAME),
+                                         json.dumps({'binary_checksum': binary_checksum,
+                                                     'covered_bbs': function_coverage(functions, covered_bbs)}))
+
+    if S2E_settings.FUNCTION_GRAPH_PRERENDER:
+        render_functions(functions, covered_bbs, output_dir, S2E_settings.FUNCTION_GRAPH_RENDER_PROCESSES)
 
     base_path = os.path.join(project_name, 's2e-out-%d' % s2e_num, 'functions')
-    return [[file_[0:-4], os.path.join(base_path, file_)] for file_ in os.listdir(output_dir)]
+    return [[file_[0:-4], os.path.join(base_path, file_)]
+            for file_ in (function_graph_file_name(function) for function in functions)]
+
+
+def function_coverage(functions, covered_bbs):
+    """
+    Returns the covered basic block start addresses of the given functions,
+    keyed by the function address as a string. Functions without covered
+    basic blocks are left out.
+    """
+    coverage = {}
+    for function in functions:
+        bbs = [bb_start_addr for bb_start_addr, _ in function['blocks'] if bb_start_addr in covered_bbs]
+        if bbs:
+            coverage[str(function['addr'])] = bbs
+
+    return coverage
+
+
+def load_function(functions_dir, file_name):
+    """
+    Loads the function whose SVG graph is `file_name` from the radare2 cache,
+    with its covered basic blocks in the analysis whose `functions` directory
+    is given.
+
+    Returns a `(function, covered basic block start addresses)` tuple, or
+    `(None, None)` if there is no such function.
+    """
+    try:
+        addr = int(os.path.splitext(file_name)[0].rsplit('_0x', 1)[1], 16)
+    except (IndexError, ValueError):
+        return None, None
+
+    try:
+        with open(os.path.join(functions_dir, FUNCTION_GRAPHS_FILE_NAME), 'r') as f:
+            function_graphs = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None, None
+
+    r2_cache = R2AnalysisCache(None, function_graphs['binary_checksum'], S2E_settings.R2_ANALYSIS_CACHE_PATH)
+    function = r2_cache.load_function(addr)
+    if not function or function_graph_file_name(function) != file_name:
+        return None, None
+
+    return function, set(function_graphs['covered_bbs'].get(str(addr), []))
+
+
+def get_function_graph(functions_dir, file_name):
+    """
+    Returns the path of the SVG graph `file_name` in the `functions` directory
+    of an analysis, rendering it first if it was never viewed.
+
+    Returns `None` if there is no such function graph.
+    """
+    svg_path = os.path.join(functions_dir, file_name)
+    if os.path.isfile(svg_path):
+        return svg_path
+
+    function, covered_bbs = load_function(functions_dir, file_name)
+    if function:
+        render_function((function, covered_bbs, functions_dir))
+
+    return svg_path if os.path.isfile(svg_path) else None
+
+
+def get_function_cfg(functions_dir, file_name):
+    """
+    Returns the control flow graph of the function whose SVG graph is
+    `file_name`, for the browser to lay out, as a dictionary with the
+    function's `name`, `addr`, `blocks` (as `[start address, size, covered]`
+    triples) and `edges` (see `block_edges`).
+
+    Returns `None` if there is no such function.
+    """
+    function, covered_bbs = load_function(functions_dir, file_name)
+    if not function:
+        return None
+
+    return {
+        'name': function['name'],
+        'addr': function['addr'],
+        'blocks': [[bb_start_addr, bb_size, int(bb_start_addr in covered_bbs)]
+                   for bb_start_addr, bb_size in function['blocks']],
+        'edges': function.get('edges', []),
+    }
@@ -0,0 +1,263 @@
+"""
+Persistent queue of the analysis jobs.
+
+Submitting an analysis stores an `AnalysisJob` in the database and returns
+immediately. A pool of worker threads, started on first use, runs the queued
+jobs: S2E itself and all the post-processing of its output. The jobs are
+claimed atomically in the database, so several server processes can share the
+queue. Jobs of the same project are never run at the same time, even by
+different server processes, because S2E numbers its output directories per
+project: a worker holds a lock file of the project while it runs one of its
+jobs.
+
+The workers only start a job when the host has the resources to run it, in
+the order chosen by the scheduler.
+"""
+
+from __future__ import print_function
+
+import contextlib
+import fcntl
+import os
+import socket
+import threading
+import traceback
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+import s2e_web.S2E_settings as settings
+from configure_and_run_analysis import models, scheduler, utils
+from configure_and_run_analysis.console_log import console_log_dir
+from configure_and_run_analysis.extract_basic_blocks import generate_graph
+from configure_and_run_analysis.launch_s2e import launch_s2e
+from configure_and_run_analysis.telemetry import TelemetrySampler
+from display_all_analysis.models import Analysis, AnalysisJob
+
+
+# Identifies the workers of this server process
+WORKER_ID = '%s:%d' % (socket.gethostname(), os.getpid())
+
+_workers = []
+_workers_lock = threading.Lock()
+_new_job = threading.Condition(_workers_lock)
+_claim_lock = threading.Lock()
+
+
+def submit(project_name, binary_checksum, config, timeout):
+    """
+    Queues an analysis of the project with the given s2e-config.lua content.
+
+    Returns the queued `AnalysisJob`.
+    """
+    job = AnalysisJob.objects.create(project_name=project_name, binary_checksum=binary_checksum,
+                                     config=config, timeout=timeout)
+    start_workers()
+
+    with _new_job:
+        _new_job.notify()
+
+    return job
+
+
+@contextlib.contextmanager
+def project_lock(project_name):
+    """
+    Serializes the submissions of analyses of a project across the server processes.
+    """
+    lock_path = os.path.join(settings.S2E_BINARY_FOLDER_PATH, '.%s.lock' % project_name)
+    with open(lock_path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def active_binary_checksums(project_name):
+    """
+    Returns the checksums of the binaries of the queued and running jobs of a project.
+    """
+    return set(AnalysisJob.objects.filter(project_name=project_name,
+                                          status__in=[AnalysisJob.QUEUED, AnalysisJob.RUNNING])
+               .values_list('binary_checksum', flat=True))
+
+
+def try_lock_project_run(project_name):
+    """
+    Takes the lock held while a job of the project runs, without waiting.
+
+    Returns the open lock file, which releases the lock when closed, or None if
+    a job of the project is running in another worker.
+    """
+    lock = open(os.path.join(settings.S2E_BINARY_FOLDER_PATH, '.%s.run.lock' % project_name), 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        lock.close()
+        return None
+
+    return lock
+
+
+def start_workers():
+    """
+    Starts the worker threads of this server process, if they are not running yet.
+    """
+    with _workers_lock:
+        if _workers:
+            return
+
+        recover_interrupted_jobs()
+
+        for _ in range(settings.ANALYSIS_WORKERS):
+            worker = threading.Thread(target=run_worker)
+            worker.daemon = True
+            worker.start()
+            _workers.append(worker)
+
+
+def recover_interrupted_jobs():
+    """
+    Fails the running jobs whose worker process on this host is gone.
+    """
+    host = socket.gethostname()
+    for job in AnalysisJob.objects.filter(status=AnalysisJob.RUNNING, worker__startswith='%s:' % host):
+        try:
+            os.kill(int(job.worker.rsplit(':', 1)[1]), 0)
+        except (OSError, ValueError):
+            AnalysisJob.objects.filter(pk=job.pk, status=AnalysisJob.RUNNING).update(
+                status=AnalysisJob.FAILED, error='The server was stopped during the analysis',
+                finished=timezone.now())
+
+
+def claim_next_job():
+    """
+    Claims the next queued job whose project has no running job, if the host
+    has the resources to run it (see `scheduler`).
+
+    Returns the claimed job and the run lock of its project (see
+    `try_lock_project_run`), to be closed once the job is finished, or
+    `(None, None)` if there is no job to run.
+    """
+    # The resources left are only checked once per claim in this process
+    with _claim_lock:
+        running_jobs = AnalysisJob.objects.filter(status=AnalysisJob.RUNNING)
+        running_projects = set(running_jobs.values_list('project_name', flat=True))
+
+        if not scheduler.can_start_run(running_jobs.count()):
+            return None, None
+
+        for job in scheduler.queued_jobs():
+            if job.project_name in running_projects:
+                continue
+
+            # Another server process may have started a job of the project
+            # since the running jobs were read
+            run_lock = try_lock_project_run(job.project_name)
+            if not run_lock:
+                continue
+
+            # Another server process may have claimed the job in the meantime
+            claimed = AnalysisJob.objects.filter(pk=job.pk, status=AnalysisJob.QUEUED).update(
+                status=AnalysisJob.RUNNING, worker=WORKER_ID, started=timezone.now())
+            if claimed:
+                return AnalysisJob.objects.get(pk=job.pk), run_lock
+            run_lock.close()
+
+    return None, None
+
+
+def run_worker():
+    """
+    Runs the queued jobs, forever.
+    """
+    while True:
+        close_old_connections()
+        try:
+            job, run_lock = claim_next_job()
+        except Exception as err:
+            print('ERROR: Failed to claim an analysis job: %s' % err)
+            job = None
+
+        if not job:
+            with _new_job:
+                _new_job.wait(settings.ANALYSIS_QUEUE_POLL_INTERVAL)
+            continue
+
+        try:
+            run_job(job)
+            job.status = AnalysisJob.DONE
+        except Exception as err:
+            traceback.print_exc()
+            job.status = AnalysisJob.FAILED
+            job.error = str(err)
+
+        # The project is only released once the job is no longer running in the database
+        try:
+            job.finished = timezone.now()
+            job.save()
+        finally:
+            run_lock.close()
+
+        # Jobs of the same project may have been waiting for this one
+        with _new_job:
+            _new_job.notify_all()
+
+
+def run_job(job):
+    """
+    Runs S2E for the job and post-processes its output.
+    """
+    project_path = os.path.join(settings.S2E_PROJECT_FOLDER_PATH, job.project_name)
+    utils.write_string_to_disk_and_close(os.path.join(project_path, "s2e-config.lua"), job.config)
+
+    s2e_num = find_next_analysis_num(job.project_name)
+    job.s2e_num = s2e_num
+    job.save()
+
+    s2e_output_dir = os.path.join(project_path, "s2e-out-%d" % s2e_num)
+
+    log_dir = console_log_dir(job.project_name, s2e_num)
+
+    # Parse the execution trace while S2E writes it instead of all at once afterwards
+    icount_follower = models.InstructionCountFollower(s2e_output_dir)
+    telemetry_sampler = TelemetrySampler(s2e_output_dir, log_dir)
+    has_s2e_error, killed_by_timeout, usage = launch_s2e(job.timeout, job.project_name,
+                                                         [telemetry_sampler.sample, icount_follower.update], log_dir)
+    telemetry_sampler.sample()
+    icount_follower.finish()
+    analysis = add_entry_to_database(s2e_num, job.project_name, job.binary_checksum, usage)
+
+    models.generate_lcov_files(s2e_output_dir, job.project_name)
+    function_paths = generate_graph(s2e_output_dir, s2e_num, job.project_name, job.binary_checksum)
+    models.merge_cumulative_coverage(s2e_output_dir, analysis.id, job.binary_checksum)
+
+    custom_data = models.CustomAnalysisData(killed_by_timeout, has_s2e_error, function_paths)
+    custom_data.save_to_disk(s2e_output_dir)
+
+
+def find_next_analysis_num(binary_name):
+    """
+    Finds the next analysis number from the binary project folder
+    """
+    s2e_num = -1
+    result_dirs = os.listdir(os.path.join(settings.S2E_PROJECT_FOLDER_PATH, binary_name))
+    analysis_numbers = [int(name[8:]) for name in result_dirs if name.startswith("s2e-out")]
+    i = 0
+    while s2e_num == -1:
+        if i not in analysis_numbers:
+            s2e_num = i
+        i += 1
+
+    return s2e_num
+
+
+def add_entry_to_database(s2e_num, project_name, binary_checksum, usage):
+    """
+    Adds an entry to the Analysis database, with the resources used by S2E (see `launch_s2e`).
+    Returns the new entry.
+    """
+    a = Analysis(s2e_num=s2e_num, binary_checksum=binary_checksum, binary_name=project_name,
+                 wall_time=usage['wall_time'], cpu_time=usage['cpu_time'], peak_rss=usage['peak_rss'])
+    a.save()
+
+    return a
+
@@ -3,33 +3,173 @@ from __future__ import print_function
 import os
 import signal
 import subprocess
-from threading import Timer
+import time
+from threading import Event, Thread, Timer
 
 import s2e_web.S2E_settings as settings
+from configure_and_run_analysis.console_log import stream_to_log
 
 
-def launch_s2e(timeout, project_name):
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+# Maximum size of the console output held in memory
+LOG_CHUNK_SIZE = 64 * 1024
+
+
+def launch_s2e(timeout, project_name, monitors=(), log_dir=None):
     """
     Launch the s2e analysis with a given timeout
+
+    S2E is started in its own session, so that the whole process tree (including QEMU) is killed
+    after the timeout. The `monitors` are called every `S2E_MONITOR_INTERVAL` seconds while the
+    analysis is running and, if given, the console output is streamed to a log in `log_dir` (see
+    `console_log`).
+
+    Returns the return code, whether the analysis was killed after the timeout and the resources
+    used by the process tree (see `ProcessGroupUsage.to_dict`).
     """
 
-    s2e_command = 'sh %s' % os.path.join(settings.S2E_PROJECT_FOLDER_PATH, project_name, 'launch-s2e.sh')
+    # `setsid` starts the new session instead of a `preexec_fn`, which is not safe to run from the
+    # worker threads. It does not fork since the child is not a process group leader, so the
+    # session and process group ids are those of `p.pid`
+    s2e_command = ['setsid', 'sh', os.path.join(settings.S2E_PROJECT_FOLDER_PATH, project_name, 'launch-s2e.sh')]
 
     kill = lambda process: kill_process(process)
 
-    p = subprocess.Popen([s2e_command, ""], shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    start_time = time.time()
+    p = subprocess.Popen(s2e_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
                          cwd=os.path.join(settings.S2E_PROJECT_FOLDER_PATH, project_name))
     p.killed_by_timeout = False
 
     my_timer = Timer(int(timeout), kill, [p])
+    my_timer.daemon = True
+
+    usage = ProcessGroupUsage(p.pid)
+    stop_monitor = Event()
+    monitor_thread = Thread(target=monitor_process, args=[monitors, usage, stop_monitor])
+    monitor_thread.daemon = True
+
+    # The output is written to disk as it comes instead of being kept in memory until the end
+    log_thread = Thread(target=stream_to_log, args=[p.stdout.fileno(), log_dir, LOG_CHUNK_SIZE])
+    log_thread.daemon = True
 
     try:
         my_timer.start()
-        p.communicate()
+        monitor_thread.start()
+        log_thread.start()
+
+        # Wait for S2E ourselves to get the resources used by it and the children it waited for
+        _, status, rusage = os.wait4(p.pid, 0)
+        usage.wall_time = time.time() - start_time
+        if not p.killed_by_timeout:
+            p.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
     finally:
+        # A timeout kill that already started is waited for instead of being done twice
         my_timer.cancel()
+        my_timer.join()
+        stop_monitor.set()
+        if monitor_thread.is_alive():
+            monitor_thread.join()
+
+        # Processes that outlived S2E (e.g. an orphaned QEMU) would keep using the host
+        usage.sample()
+        if not p.killed_by_timeout:
+            kill_process_group(p.pid)
+
+    # The pipe is closed once all the processes of the group are gone
+    log_thread.join(settings.S2E_KILL_GRACE_PERIOD)
+    if not log_thread.is_alive():
+        p.stdout.close()
 
-    return p.returncode, p.killed_by_timeout
+    usage.add_rusage(rusage)
+
+    return p.returncode, p.killed_by_timeout, usage.to_dict()
+
+
+class ProcessGroupUsage(object):
+    """
+    Resources used by the processes of a process group, sampled from /proc.
+    """
+
+    def __init__(self, pgid):
+        self.pgid = pgid
+        self.wall_time = 0.0
+        # CPU time (in seconds) of every process ever seen in the group
+        self.cpu_times = {}
+        self.peak_rss = 0
+        self.rusage_cpu_time = 0.0
+        self.rusage_peak_rss = 0
+
+    def sample(self):
+        """
+        Records the CPU time and memory used by the processes that are currently in the group.
+        """
+        rss = 0
+        for pid, pgrp, cpu_time, process_rss in read_processes():
+            if pgrp == self.pgid:
+                self.cpu_times[pid] = cpu_time
+                rss += process_rss
+
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def add_rusage(self, rusage):
+        """
+        Records the resources reported for the group leader and the children it waited for.
+        """
+        self.rusage_cpu_time = rusage.ru_utime + rusage.ru_stime
+        # ru_maxrss is in kilobytes, the largest process only
+        self.rusage_peak_rss = rusage.ru_maxrss * 1024
+
+    def to_dict(self):
+        """
+        Returns the wall time, CPU time (in seconds) and peak resident memory (in bytes) of the group.
+        """
+        return {
+            'wall_time': self.wall_time,
+            'cpu_time': max(self.rusage_cpu_time, sum(self.cpu_times.values())),
+            'peak_rss': max(self.rusage_peak_rss, self.peak_rss),
+        }
+
+
+def read_processes():
+    """
+    Yields the pid, process group, CPU time (in seconds) and resident memory (in bytes) of the
+    processes of the host.
+    """
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+
+        try:
+            with open(os.path.join('/proc', name, 'stat'), 'r') as stat_file:
+                stat = stat_file.read()
+        except (IOError, OSError):
+            # The process exited in the meantime
+            continue
+
+        # The command name is between parentheses and may contain spaces
+        fields = stat[stat.rfind(')') + 2:].split()
+        yield (int(name), int(fields[2]), (int(fields[11]) + int(fields[12])) / float(CLOCK_TICKS),
+               int(fields[21]) * PAGE_SIZE)
+
+
+def monitor_process(monitors, usage, stop_event):
+    """
+    Sample the resources used by the analysis and call the monitors periodically until the stop
+    event is set
+    """
+    while not stop_event.wait(settings.S2E_MONITOR_INTERVAL):
+        try:
+            usage.sample()
+        except Exception as err:
+            print("WARN: Sampling the resources of the analysis failed: %s" % err)
+
+        for monitor in monitors:
+            try:
+                monitor()
+            except Exception as err:
+                print("Monitoring of the analysis failed: %s" % err)
 
 
 def kill_process(process):
@@ -38,14 +178,37 @@ def kill_process(process):
     """
     print("Process killed after timeout")
 
-    os.kill(process.pid, signal.SIGTERM)
-
-    #XXX This is required to kill the qemu process, but should be fixed in something more reliable
-    os.kill(process.pid + 3, signal.SIGTERM)
-
     process.returncode = 0;
     process.killed_by_timeout = True
 
+    kill_process_group(process.pid)
+
+
+def kill_process_group(pgid):
+    """
+    Terminate all the processes of a group, and kill those that are still running after
+    `S2E_KILL_GRACE_PERIOD` seconds
+    """
+    try:
+        os.killpg(pgid, signal.SIGTERM)
+    except OSError:
+        # The group has no process left
+        return
+
+    deadline = time.time() + settings.S2E_KILL_GRACE_PERIOD
+    while time.time() < deadline:
+        try:
+            os.killpg(pgid, 0)
+        except OSError:
+            return
+        time.sleep(0.1)
+
+    print("WARN: Processes of group %d still running after SIGTERM, sending SIGKILL" % pgid)
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except OSError:
+        pass
+
 
 def create_new_s2e_project(binary_path):
     s2e_create_project_command = 's2e new_project -e %s %s' % (settings.S2E_ENVIRONMENT_FOLDER_PATH, binary_path)
@@ -5,8 +5,15 @@ import os
 import subprocess
 
 import s2e_web.S2E_settings as settings
+import tools.execution_tracer.columnar as columnar
 import tools.execution_tracer.execution_trace_parser as execution_parser
+import tools.execution_tracer.reducers as reducers
+from tools.execution_tracer.trace_cache import TraceCache
+from tools.execution_tracer.trace_index import TraceIndex, TraceIndexBuilder
+from tools.execution_tracer.structs import TraceEntryType
 from configure_and_run_analysis import utils
+from configure_and_run_analysis.cumulative_coverage import CumulativeCoverage, NEW_COVERAGE_FILE_NAME
+from configure_and_run_analysis.run_coverage import RunCoverage
 
 
 class S2EOutput(object):
@@ -78,39 +85,254 @@ def get_lcov_path(s2e_out_dir, s2e_num, binary_name):
     return has_line_cov, line_cov_path
 
 
-def generate_icount_files(s2e_out_dir):
+def merge_cumulative_coverage(s2e_out_dir, analysis_id, binary_checksum):
     """
-    Generate the instruction count data for the given output directory.
+    Merges the coverage of the given output directory, of the analysis with
+    the given `Analysis` id, into the cumulative coverage of the analyzed
+    binary.
+    """
+    cumulative_coverage = CumulativeCoverage(binary_checksum, settings.CUMULATIVE_COVERAGE_PATH)
+    try:
+        cumulative_coverage.merge_run(analysis_id, s2e_out_dir)
+    except (IOError, OSError) as err:
+        print('WARN: Failed to merge the coverage of %s: %s' % (s2e_out_dir, err))
+
+
+def rebuild_cumulative_coverage(binary_checksum, runs):
+    """
+    Rebuilds the cumulative coverage of a binary from the `(Analysis id,
+    output directory)` of its remaining analyses, e.g. after one of them was
+    deleted.
+    """
+    cumulative_coverage = CumulativeCoverage(binary_checksum, settings.CUMULATIVE_COVERAGE_PATH)
+    try:
+        cumulative_coverage.rebuild(runs)
+    except (IOError, OSError) as err:
+        print('WARN: Failed to rebuild the cumulative coverage of %s: %s' % (binary_checksum, err))
+
+
+def get_coverage_summaries(s2e_out_dir, binary_checksum):
+    """
+    Gets the summaries of the coverage of the given output directory, of the
+    coverage it added to the earlier analyses of the binary and of the
+    cumulative coverage of all of them. Any of them is None if it is missing.
+    """
+    summaries = {'run': None, 'new': None, 'cumulative': None, 'cumulative_runs': 0}
+
+    coverage = RunCoverage.load(s2e_out_dir)
+    if coverage:
+        summaries['run'] = coverage.summary()
+
+    new_coverage = RunCoverage.load(s2e_out_dir, NEW_COVERAGE_FILE_NAME)
+    if new_coverage:
+        summaries['new'] = new_coverage.summary()
+
+    if binary_checksum:
+        cumulative_coverage = CumulativeCoverage(binary_checksum, settings.CUMULATIVE_COVERAGE_PATH)
+        total = cumulative_coverage.load()
+        if total:
+            summaries['cumulative'] = total.summary()
+            summaries['cumulative_runs'] = len(cumulative_coverage.merged_runs())
+
+    return summaries
+
+
+# The aggregates computed over the execution trace of every analysis, in a
+# single pass
+TRACE_REDUCERS = [
+    reducers.InstructionCountReducer,
+    reducers.CallReturnCountReducer,
+    reducers.ForkCountReducer,
+    reducers.ExceptionCountReducer,
+]
+
+
+def generate_trace_aggregates(s2e_out_dir):
+    """
+    Generate the aggregates of the execution trace for the given output
+    directory, as a `{aggregate name: dict}` dictionary.
     """
     file_path = os.path.join(s2e_out_dir, "ExecutionTracer.dat")
 
     if not os.path.exists(file_path):
         return
 
-    data = execution_parser.main(file_path)
-    if not data:
+    # The aggregates are only computed on the first view of the analysis,
+    # later views read them back from the trace cache. The dictionaries are
+    # cached as lists of pairs since JSON only has string keys
+    cache = TraceCache(file_path)
+
+    def compute(names):
+        aggregates = compute_trace_aggregates(file_path, names, cache)
+        return dict((name, sorted(aggregate.items())) for name, aggregate in aggregates.items())
+
+    try:
+        aggregates = cache.aggregates([reducer_cls.NAME for reducer_cls in TRACE_REDUCERS], compute)
+    except execution_parser.S2ETraceParserException as err:
+        print('ERROR: %s' % err)
         return
 
-    instruction_count = {}
-    data_last_timestamp = 0
-    for i in range(len(data)):
-        data_icount = data[i]["iCount"]
-        data_current_timestamp = data_icount["timestamp"]
-        data_current_state = data_icount["stateId"]
-        data_current_count = data_icount["count"]
+    return dict((name, dict(aggregate)) for name, aggregate in aggregates.items())
 
-        instruction_count[data_current_state] = data_current_count
 
-        if data_current_timestamp < data_last_timestamp:
-            print("assumption wrong on timestamp: %s" % data_current_timestamp)
+def get_trace_summary(s2e_out_dir):
+    """
+    Gets the number of records of every state of the execution trace, by
+    entry type name, and the timestamps of its first and last records, from
+    the trace index. Returns None if there is no trace.
+    """
+    file_path = os.path.join(s2e_out_dir, "ExecutionTracer.dat")
+
+    if not os.path.exists(file_path):
+        return
+
+    # The index is normally built by the first computation of the aggregates
+    try:
+        index = TraceIndex.open(file_path)
+    except execution_parser.S2ETraceParserException as err:
+        print('ERROR: %s' % err)
+        return
+
+    states = {}
+    for state_id, counts in index.state_record_counts().items():
+        states[state_id] = {
+            'records': sum(counts.values()),
+            'by_type': dict((execution_parser.ENTRY_NAMES.get(entry_type, entry_type), count)
+                            for entry_type, count in counts.items()),
+        }
+
+    time_span = index.time_span()
+
+    return {'states': states,
+            'start_time': time_span[0] if time_span else None,
+            'end_time': time_span[1] if time_span else None}
+
 
-        data_last_timestamp = data_current_timestamp
+def generate_icount_files(s2e_out_dir, aggregates=None):
+    """
+    Generate the instruction count data for the given output directory.
+    """
+    if aggregates is None:
+        aggregates = generate_trace_aggregates(s2e_out_dir)
+    if not aggregates:
+        return
+
+    instruction_count = aggregates[reducers.InstructionCountReducer.NAME]
+    if not instruction_count:
+        return
 
     print(instruction_count)
 
     return instruction_count
 
 
+def compute_trace_aggregates(file_path, names, cache=None):
+    """
+    Computes the trace aggregates with the given names, with the fastest
+    method available for the size of the trace.
+    """
+    reducer_classes = [reducer_cls for reducer_cls in TRACE_REDUCERS if reducer_cls.NAME in names]
+    is_large_trace = os.path.getsize(file_path) >= settings.EXECUTION_TRACE_PARALLEL_MIN_SIZE
+    use_columnar_icount = (columnar.HAS_NUMPY and not is_large_trace and
+                           reducers.InstructionCountReducer in reducer_classes)
+    aggregates = {}
+
+    # The index is collected by the first pass over the trace instead of a
+    # pass of its own, the later passes load it from disk
+    index = TraceIndex.load(file_path)
+    index_builder = TraceIndexBuilder(file_path) if index is None else None
+
+    if use_columnar_icount:
+        reducer_classes.remove(reducers.InstructionCountReducer)
+
+    if reducer_classes:
+        if is_large_trace:
+            trace_reducers = reducers.parallel_reduce_trace(file_path, reducer_classes, index,
+                                                            index_builder=index_builder)
+        else:
+            trace_reducers = reducers.reduce_trace(file_path, reducer_classes, index, index_builder)
+        if index_builder is not None:
+            index = index_builder.finish()
+
+        for reducer in trace_reducers:
+            if isinstance(reducer, reducers.InstructionCountReducer):
+                for data_current_timestamp in reducer.out_of_order_timestamps:
+                    print("assumption wrong on timestamp: %s" % data_current_timestamp)
+            aggregates[reducer.NAME] = reducer.result()
+
+    if use_columnar_icount:
+        aggregates[reducers.InstructionCountReducer.NAME] = columnar_icount(file_path, index, cache)
+
+    return aggregates
+
+
+def columnar_icount(file_path, index=None, cache=None):
+    """
+    Computes the last instruction count of every state with NumPy. The
+    decoded entries are stored in `cache`, if given.
+    """
+    if cache is not None:
+        columns = cache.columns([TraceEntryType.TRACE_ICOUNT], index)
+    else:
+        columns = columnar.decode_columns(file_path, [TraceEntryType.TRACE_ICOUNT], index)
+    icounts = columns.get(TraceEntryType.TRACE_ICOUNT)
+    if icounts is None:
+        return {}
+
+    for data_current_timestamp in columnar.decreasing_values(icounts["timestamp"]):
+        print("assumption wrong on timestamp: %s" % data_current_timestamp)
+
+    return columnar.last_value_per_state(icounts, "count")
+
+
+class InstructionCountFollower(object):
+    """
+    Computes the instruction count of every state while S2E is still
+    writing the execution trace.
+    """
+    def __init__(self, s2e_out_dir):
+        self.file_path = os.path.join(s2e_out_dir, "ExecutionTracer.dat")
+        self._parser = None
+        self._reducer = reducers.InstructionCountReducer()
+
+    @property
+    def instruction_count(self):
+        return self._reducer.result()
+
+    def update(self):
+        """
+        Parses the entries appended to the trace since the last update and
+        returns the current instruction counts.
+        """
+        if self._parser is None:
+            if not os.path.exists(self.file_path):
+                return self.instruction_count
+            self._parser = execution_parser.S2ETraceParser(self.file_path)
+
+        num_out_of_order = len(self._reducer.out_of_order_timestamps)
+        reducers.run_reducers(self._parser.poll(reducers.InstructionCountReducer.ENTRY_TYPES), [self._reducer])
+        for data_current_timestamp in self._reducer.out_of_order_timestamps[num_out_of_order:]:
+            print("assumption wrong on timestamp: %s" % data_current_timestamp)
+
+        return self.instruction_count
+
+    def finish(self):
+        """
+        Parses the end of the trace once S2E has terminated and stores the
+        instruction counts in the trace cache, so that they are not computed
+        again when the analysis is displayed.
+        """
+        try:
+            self.update()
+        except execution_parser.S2ETraceParserException as err:
+            print('ERROR: %s' % err)
+            return
+
+        if self._parser is not None:
+            TraceCache(self.file_path).aggregate(reducers.InstructionCountReducer.NAME,
+                                                 lambda: sorted(self.instruction_count.items()))
+
+
 class CustomAnalysisData(object):
     """
     Class that stores all the custom data used for the GUI.
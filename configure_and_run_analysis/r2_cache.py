@@ -0,0 +1,109 @@
+"""
+Cache of the radare2 analysis of the analyzed binaries.
+
+The functions extracted from a binary with radare2 (see
+`extract_basic_blocks.extract_functions`) are persisted in files named after
+the SHA-256 checksum of the binary, so that repeated analyses of the same
+binary skip radare2 entirely, and so that the analyses only need to reference
+the functions by that checksum.
+
+The functions are stored one per line, in a JSON lines file, next to a small
+index of the offset of every function in it, so that a single function can
+be read without parsing the others.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+
+
+# Bump whenever the layout of the cache files changes
+CACHE_VERSION = 4
+
+
+class R2AnalysisCache(object):
+    """
+    Cache of the functions extracted from a binary.
+    """
+
+    def __init__(self, binary_path, checksum, cache_dir):
+        self.binary_path = binary_path
+        self.checksum = checksum
+        self.functions_path = os.path.join(cache_dir, '%s.functions' % checksum)
+        self.index_path = os.path.join(cache_dir, '%s.index.json' % checksum)
+
+    def _load_index(self):
+        """
+        Returns the `{function address: [offset, size]}` index of the
+        functions file, or `None` if it is missing or outdated.
+        """
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if not index or index.get('version') != CACHE_VERSION:
+            return None
+
+        return index['functions']
+
+    def load(self):
+        """
+        Returns the cached functions of the binary, or `None` if the binary
+        was not analyzed before.
+        """
+        if self._load_index() is None:
+            return None
+
+        try:
+            with open(self.functions_path, 'r') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except (IOError, OSError, ValueError):
+            return None
+
+    def load_function(self, addr):
+        """
+        Returns the cached function at the given address, or `None` if there
+        is none.
+        """
+        index = self._load_index()
+        if not index or str(addr) not in index:
+            return None
+
+        offset, size = index[str(addr)]
+        try:
+            with open(self.functions_path, 'r') as f:
+                f.seek(offset)
+                return json.loads(f.read(size))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, functions):
+        """
+        Writes the functions of the binary to the cache.
+        """
+        cache_dir = os.path.dirname(self.index_path)
+        tmp_paths = ['%s.%d.tmp' % (path, os.getpid()) for path in (self.functions_path, self.index_path)]
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+
+            index = {}
+            with open(tmp_paths[0], 'w') as f:
+                for function in functions:
+                    line = json.dumps(function)
+                    index[str(function['addr'])] = [f.tell(), len(line)]
+                    f.write(line + '\n')
+            with open(tmp_paths[1], 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'functions': index}, f)
+
+            # The index is replaced last, the functions are only read through it
+            os.rename(tmp_paths[0], self.functions_path)
+            os.rename(tmp_paths[1], self.index_path)
+        except (IOError, OSError) as err:
+            print('WARN: Failed to write the radare2 cache of %s: %s' % (self.binary_path, err))
+            for tmp_path in tmp_paths:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
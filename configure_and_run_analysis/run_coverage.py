@@ -0,0 +1,248 @@
+"""
+Compact persisted coverage of an analysis run.
+
+The covered translation blocks of the target module are stored as sorted,
+disjoint `[start, end)` address runs and the covered basic blocks as their
+sorted start addresses, in a small binary file in the `s2e-out-N` directory.
+Both sets are delta-encoded and compressed, so that coverage queries and
+summaries only need to load this file instead of reparsing the coverage JSON
+files.
+"""
+
+from __future__ import print_function
+
+import bisect
+import os
+import struct
+import zlib
+
+from tools.execution_tracer.arrays import uint64_array, uint64_array_from_bytes, uint64_array_to_bytes
+
+
+COVERAGE_FILE_NAME = 'coverage.runs'
+
+# Bump whenever the layout of the coverage file changes
+COVERAGE_VERSION = 1
+
+_MAGIC = b'S2ECOV\0\0'
+_FILE_HEADER = struct.Struct('<8sIQQI')
+_SECTION_HEADER = struct.Struct('<QI')
+
+
+def _write_addrs(f, addrs):
+    """
+    Writes a sorted array of addresses, delta-encoded and compressed.
+    """
+    deltas = uint64_array(b - a for a, b in zip([0] + list(addrs[:-1]), addrs))
+
+    data = zlib.compress(uint64_array_to_bytes(deltas))
+    f.write(_SECTION_HEADER.pack(len(deltas), len(data)))
+    f.write(data)
+
+
+def _read_addrs(f):
+    header = f.read(_SECTION_HEADER.size)
+    if len(header) != _SECTION_HEADER.size:
+        raise EOFError('Unexpected end of coverage file')
+
+    count, size = _SECTION_HEADER.unpack(header)
+    deltas = uint64_array_from_bytes(zlib.decompress(f.read(size)))
+    if len(deltas) != count:
+        raise EOFError('Unexpected end of coverage file')
+
+    addrs = uint64_array()
+    addr = 0
+    for delta in deltas:
+        addr += delta
+        addrs.append(addr)
+
+    return addrs
+
+
+def tb_runs(covered_tbs):
+    """
+    Merges `(start, end)` translation blocks, sorted by start address and
+    whose end address is inclusive, into a flat array of disjoint
+    `[start, end)` address runs.
+    """
+    runs = uint64_array()
+    for tb_start_addr, tb_end_addr in covered_tbs:
+        if runs and tb_start_addr <= runs[-1]:
+            runs[-1] = max(runs[-1], tb_end_addr + 1)
+        else:
+            runs.append(tb_start_addr)
+            runs.append(tb_end_addr + 1)
+
+    return runs
+
+
+def union_runs(runs, other_runs):
+    """
+    Returns the union of two flat arrays of disjoint `[start, end)` runs.
+    """
+    pairs = sorted(list(zip(runs[0::2], runs[1::2])) + list(zip(other_runs[0::2], other_runs[1::2])))
+
+    return tb_runs((start, end - 1) for start, end in pairs)
+
+
+def subtract_runs(runs, other_runs):
+    """
+    Returns the addresses of the `runs` that are not in the `other_runs`, as a
+    flat array of disjoint `[start, end)` runs.
+    """
+    result = uint64_array()
+    other_pairs = list(zip(other_runs[0::2], other_runs[1::2]))
+    i = 0
+
+    for start, end in zip(runs[0::2], runs[1::2]):
+        # Skip the other runs that end before this one
+        while i < len(other_pairs) and other_pairs[i][1] <= start:
+            i += 1
+
+        j = i
+        while start < end and j < len(other_pairs) and other_pairs[j][0] < end:
+            other_start, other_end = other_pairs[j]
+            if other_start > start:
+                result.append(start)
+                result.append(other_start)
+            start = max(start, other_end)
+            j += 1
+
+        if start < end:
+            result.append(start)
+            result.append(end)
+
+    return result
+
+
+class RunCoverage(object):
+    """
+    Covered translation blocks and basic blocks of a module in a run.
+    """
+
+    def __init__(self, module, range_start, range_end, tb_runs_, covered_bbs):
+        self.module = module
+
+        # `[range_start, range_end)` spans all the covered addresses
+        self.range_start = range_start
+        self.range_end = range_end
+
+        # Flat array of the disjoint `[start, end)` runs of covered addresses
+        self.tb_runs = tb_runs_
+        # Sorted start addresses of the covered basic blocks
+        self.covered_bbs = covered_bbs
+
+    @classmethod
+    def from_blocks(cls, module, covered_tbs, covered_bbs):
+        """
+        Builds the coverage from `(start, end)` covered TBs, sorted by start
+        address, and the start addresses of the covered basic blocks.
+        """
+        return cls.from_runs(module, tb_runs(covered_tbs), uint64_array(sorted(covered_bbs)))
+
+    @classmethod
+    def from_runs(cls, module, runs, bbs):
+        """
+        Builds the coverage from a flat array of `[start, end)` runs and a
+        sorted array of basic block start addresses.
+        """
+        bounds = list(runs[:1]) + list(runs[-1:]) + list(bbs[:1]) + [bb + 1 for bb in bbs[-1:]]
+        range_start = min(bounds) if bounds else 0
+        range_end = max(bounds) if bounds else 0
+
+        return cls(module, range_start, range_end, runs, bbs)
+
+    @classmethod
+    def load(cls, s2e_output_dir, file_name=COVERAGE_FILE_NAME):
+        """
+        Loads the coverage of a run. Returns `None` if there is none, or if it
+        is corrupted.
+        """
+        try:
+            with open(os.path.join(s2e_output_dir, file_name), 'rb') as f:
+                header = f.read(_FILE_HEADER.size)
+                if len(header) != _FILE_HEADER.size:
+                    return None
+
+                magic, version, range_start, range_end, module_size = _FILE_HEADER.unpack(header)
+                if magic != _MAGIC or version != COVERAGE_VERSION:
+                    return None
+
+                module = f.read(module_size).decode('utf-8')
+                runs = _read_addrs(f)
+                bbs = _read_addrs(f)
+        except (IOError, OSError, EOFError, struct.error, zlib.error):
+            return None
+
+        return cls(module, range_start, range_end, runs, bbs)
+
+    def save(self, s2e_output_dir, file_name=COVERAGE_FILE_NAME):
+        """
+        Writes the coverage to the `s2e-out-N` directory of the run.
+        """
+        path = os.path.join(s2e_output_dir, file_name)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        module = self.module.encode('utf-8')
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(_FILE_HEADER.pack(_MAGIC, COVERAGE_VERSION, self.range_start, self.range_end,
+                                          len(module)))
+                f.write(module)
+                _write_addrs(f, self.tb_runs)
+                _write_addrs(f, self.covered_bbs)
+        except (IOError, OSError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        os.rename(tmp_path, path)
+
+    def union(self, other):
+        """
+        Returns the coverage of both this run and the `other` one.
+        """
+        return RunCoverage.from_runs(self.module, union_runs(self.tb_runs, other.tb_runs),
+                                     uint64_array(sorted(set(self.covered_bbs) | set(other.covered_bbs))))
+
+    def difference(self, other):
+        """
+        Returns the coverage of this run that the `other` one does not have.
+        """
+        return RunCoverage.from_runs(self.module, subtract_runs(self.tb_runs, other.tb_runs),
+                                     uint64_array(sorted(set(self.covered_bbs) - set(other.covered_bbs))))
+
+    def is_covered(self, addr):
+        """
+        Checks if a covered translation block spans the given address.
+        """
+        # Addresses in a run are preceded by an odd number of run bounds
+        return bisect.bisect_right(self.tb_runs, addr) % 2 == 1
+
+    def covered_size(self):
+        """
+        Returns the number of covered bytes.
+        """
+        return sum(self.tb_runs[1::2]) - sum(self.tb_runs[0::2])
+
+    def covered_functions(self, functions):
+        """
+        Returns the addresses of the given functions (see
+        `extract_basic_blocks.extract_functions`) with a covered basic block.
+        """
+        covered_bbs = set(self.covered_bbs)
+
+        return [function['addr'] for function in functions
+                if any(bb_start_addr in covered_bbs for bb_start_addr, _ in function['blocks'])]
+
+    def summary(self):
+        """
+        Returns a summary of the coverage, as a dictionary.
+        """
+        return {
+            'module': self.module,
+            'range': [self.range_start, self.range_end],
+            'covered_bytes': self.covered_size(),
+            'covered_runs': len(self.tb_runs) // 2,
+            'covered_basic_blocks': len(self.covered_bbs),
+        }
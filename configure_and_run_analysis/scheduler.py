@@ -0,0 +1,114 @@
+"""
+Resource-aware scheduling of the queued analysis jobs.
+
+Every S2E run starts a QEMU instance that keeps `S2E_RUN_CORES` cores busy
+and may use up to `S2E_RUN_MEMORY` bytes. A queued job is only started if the
+host has that many cores and that much memory left, so that concurrent
+submissions wait in line instead of all starting at once and thrashing the
+host until they time out. The queued jobs are started in the order given by
+`ANALYSIS_QUEUE_ORDER`.
+"""
+
+from __future__ import print_function
+
+import multiprocessing
+import os
+
+import s2e_web.S2E_settings as settings
+from display_all_analysis.models import AnalysisJob
+
+
+FIFO_ORDER = 'fifo'
+SHORTEST_TIMEOUT_ORDER = 'shortest_timeout'
+
+# Fields by which the queued jobs are sorted in every order
+QUEUE_ORDERS = {
+    FIFO_ORDER: ('created', 'id'),
+    SHORTEST_TIMEOUT_ORDER: ('timeout', 'created', 'id'),
+}
+
+
+def queue_order():
+    """
+    Returns the fields by which the queued jobs are sorted.
+    """
+    try:
+        return QUEUE_ORDERS[settings.ANALYSIS_QUEUE_ORDER]
+    except KeyError:
+        print('WARN: Unknown analysis queue order "%s", using "%s"' % (settings.ANALYSIS_QUEUE_ORDER, FIFO_ORDER))
+        return QUEUE_ORDERS[FIFO_ORDER]
+
+
+def queued_jobs():
+    """
+    Returns the queued jobs, in the order in which they are started.
+    """
+    return AnalysisJob.objects.filter(status=AnalysisJob.QUEUED).order_by(*queue_order())
+
+
+def queue_position(job):
+    """
+    Returns the number of queued jobs that are started before the given one.
+    """
+    position = 0
+    for queued_job_id in queued_jobs().values_list('id', flat=True):
+        if queued_job_id == job.id:
+            return position
+        position += 1
+
+    return position
+
+
+def available_memory():
+    """
+    Returns the memory (in bytes) available for new processes, or None if it
+    is unknown.
+    """
+    try:
+        with open('/proc/meminfo', 'r') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+
+    return None
+
+
+def free_cores(running_runs):
+    """
+    Returns the number of cores not used by the running analyses or by the
+    other processes of the host.
+    """
+    cores = multiprocessing.cpu_count()
+
+    # The load average lags behind the runs that were just started
+    used_cores = running_runs * settings.S2E_RUN_CORES
+    try:
+        used_cores = max(used_cores, os.getloadavg()[0])
+    except OSError:
+        pass
+
+    return cores - used_cores
+
+
+def can_start_run(running_runs):
+    """
+    Checks if the host has enough cores and memory left to start an analysis
+    while `running_runs` analyses are running.
+    """
+    # Always run one analysis, even if it does not fit on the host
+    if not running_runs:
+        return True
+
+    if settings.S2E_MAX_RUNS is not None and running_runs >= settings.S2E_MAX_RUNS:
+        return False
+
+    if free_cores(running_runs) < settings.S2E_RUN_CORES:
+        return False
+
+    memory = available_memory()
+    if memory is not None and memory < settings.S2E_RUN_MEMORY:
+        return False
+
+    return True
@@ -0,0 +1,248 @@
+"""
+Streaming reader of the translation block coverage files generated by S2E's
+``TranslationBlockCoverage`` plugin.
+
+A coverage file is a JSON object mapping every module to a list of
+``[start, end, size]`` translation blocks. The file is read in chunks, the
+translation blocks of the target module are stored in a compact array and the
+other modules are skipped without being built in memory.
+
+The translation blocks of several coverage files are deduplicated and merged
+as NumPy arrays of `(start, end)` pairs if NumPy is available.
+"""
+
+import json
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from tools.execution_tracer.arrays import uint64_array
+
+
+# Size of the chunks in which the coverage files are read
+CHUNK_SIZE = 1024 * 1024
+
+# `(start, end)` pairs of translation blocks, sorted by start address
+TB_DTYPE = [('start', '<u8'), ('end', '<u8')]
+
+_WHITESPACE_RE = re.compile(r'\s*')
+_PUNCTUATION_RE = re.compile(r'\s*([\[\]{},:])')
+_STRING_RE = re.compile(r'\s*"((?:[^"\\]|\\.)*)"')
+_SCALAR_RE = re.compile(r'\s*(?:"(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)')
+_NESTED_RE = re.compile(r'[\[\]{}"]')
+_NUMBER_RE = re.compile(r'\d+')
+_TBS_END_RE = re.compile(r'\]\s*\]')
+
+
+class TBCoverageParseError(ValueError):
+    """
+    Raised when a translation block coverage file is malformed.
+    """
+    pass
+
+
+class _JSONStream(object):
+    """
+    Chunked buffer over a JSON file, matched with regular expressions.
+    """
+
+    def __init__(self, f, chunk_size):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def fill(self):
+        """
+        Reads the next chunk into the buffer, dropping the consumed data.
+        Returns `False` at the end of the file.
+        """
+        data = self._f.read(self._chunk_size)
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        self._eof = not data
+
+        return not self._eof
+
+    def buffer(self):
+        """
+        Returns the buffer and the current position in it.
+        """
+        return self._buf, self._pos
+
+    def seek(self, pos):
+        self._pos = pos
+
+    def match(self, regex):
+        """
+        Matches `regex` at the current position and consumes it. A match that
+        reaches the end of the buffer may be a truncated token, so more data
+        is read before it is accepted.
+        """
+        while True:
+            m = regex.match(self._buf, self._pos)
+            if self._eof or (m and m.end() < len(self._buf)):
+                if m:
+                    self._pos = m.end()
+                return m
+            self.fill()
+
+    def expect(self, regex, what):
+        m = self.match(regex)
+        if not m:
+            raise TBCoverageParseError('Expected %s at "%s"' % (what, self._buf[self._pos:self._pos + 20]))
+
+        return m
+
+    def peek(self):
+        """
+        Returns the next non-whitespace character, or '' at the end of the file.
+        """
+        self.match(_WHITESPACE_RE)
+        if self._pos == len(self._buf) and not self._eof:
+            self.fill()
+            return self.peek()
+
+        return self._buf[self._pos:self._pos + 1]
+
+    def skip_value(self):
+        """
+        Skips a JSON value by only looking at its brackets and strings.
+        """
+        if self.peek() not in ('[', '{'):
+            self.expect(_SCALAR_RE, 'a value')
+            return
+
+        depth = 0
+        while True:
+            # Whole chunks without strings that do not close the value are
+            # skipped by counting their brackets
+            buf, pos = self._buf, self._pos
+            if buf.find('"', pos) == -1:
+                chunk_depth = depth + buf.count('[', pos) + buf.count('{', pos) - \
+                              buf.count(']', pos) - buf.count('}', pos)
+                if chunk_depth > 0:
+                    depth = chunk_depth
+                    self._pos = len(buf)
+                    if not self.fill():
+                        raise TBCoverageParseError('Unexpected end of file')
+                    continue
+
+            for m in _NESTED_RE.finditer(buf, pos):
+                if m.group() == '"':
+                    # Strings may hold brackets, skip them as a whole
+                    self._pos = m.start()
+                    self.expect(_STRING_RE, 'a string')
+                    break
+
+                depth += 1 if m.group() in '[{' else -1
+                if not depth:
+                    self._pos = m.end()
+                    return
+            else:
+                self._pos = len(buf)
+                if not self.fill():
+                    raise TBCoverageParseError('Unexpected end of file')
+
+
+def _read_tbs(stream, tbs):
+    """
+    Appends the `start, end, size` of the translation blocks of a module to
+    `tbs`. The list only holds numbers, so the numbers of all the complete
+    translation blocks in the buffer are extracted at once.
+    """
+    stream.expect(_PUNCTUATION_RE, '[')
+    if stream.peek() == ']':
+        stream.expect(_PUNCTUATION_RE, ']')
+        return
+
+    while True:
+        buf, pos = stream.buffer()
+        m = _TBS_END_RE.search(buf, pos)
+        # The last translation block of the buffer ends at its last bracket
+        end = m.start() if m else buf.rfind(']', pos)
+
+        if end > pos:
+            numbers = _NUMBER_RE.findall(buf, pos, end)
+            if len(numbers) % 3:
+                raise TBCoverageParseError('Expected [start, end, size] translation blocks')
+            tbs.extend(map(int, numbers))
+
+        if m:
+            stream.seek(m.end())
+            return
+
+        stream.seek(max(pos, end))
+        if not stream.fill():
+            raise TBCoverageParseError('Unexpected end of file')
+
+
+def read_module_tbs(f, module, chunk_size=CHUNK_SIZE):
+    """
+    Reads the translation blocks of `module` from a coverage file object.
+
+    Returns a `(module names, translation blocks)` tuple, where the
+    translation blocks are a flat array of `start, end, size` triples, or
+    `None` if the module is not in the file.
+    """
+    stream = _JSONStream(f, chunk_size)
+    modules = []
+    tbs = None
+
+    if stream.expect(_PUNCTUATION_RE, '{').group(1) != '{':
+        raise TBCoverageParseError('Expected {')
+    if stream.peek() == '}':
+        return modules, tbs
+
+    while True:
+        name = json.loads('"%s"' % stream.expect(_STRING_RE, 'a module name').group(1))
+        stream.expect(_PUNCTUATION_RE, ':')
+        modules.append(name)
+
+        if name == module:
+            if tbs is None:
+                tbs = uint64_array()
+            _read_tbs(stream, tbs)
+        else:
+            stream.skip_value()
+
+        if stream.expect(_PUNCTUATION_RE, ', or }').group(1) == '}':
+            return modules, tbs
+
+
+def unique_tbs(tbs):
+    """
+    Returns the sorted, deduplicated `(start, end)` pairs of a flat array of
+    `start, end, size` triples, as a `TB_DTYPE` array if NumPy is available
+    and as a list otherwise.
+    """
+    if np is None:
+        return sorted(set(zip(tbs[0::3], tbs[1::3])))
+
+    triples = np.frombuffer(tbs, dtype='=u8').reshape(-1, 3)
+    pairs = np.empty(len(triples), dtype=TB_DTYPE)
+    pairs['start'] = triples[:, 0]
+    pairs['end'] = triples[:, 1]
+
+    return np.unique(pairs)
+
+
+def merge_tbs(unique_tbs_list):
+    """
+    Merges the results of `unique_tbs` into a sorted list of distinct
+    `(start, end)` pairs.
+    """
+    if not unique_tbs_list:
+        return []
+
+    if np is None:
+        merged = set()
+        for tbs in unique_tbs_list:
+            merged.update(tbs)
+        return sorted(merged)
+
+    return np.unique(np.concatenate(unique_tbs_list)).tolist()
@@ -0,0 +1,146 @@
+"""
+Live telemetry of a running analysis.
+
+While S2E runs, the last row of its `run.stats` and the total size of the
+translation block coverage files are sampled every `S2E_MONITOR_INTERVAL`
+seconds and appended to a JSON lines file in the log directory of the
+analysis (see `console_log.console_log_dir`). Each sample is a
+`[time, tbcoverage bytes, tbcoverage files, stats]` array, where the stats
+are only stored when they changed since the previous sample. A run whose
+stats and coverage stop growing is most likely stuck.
+
+The samples are read incrementally: the cursor of a client is the offset in
+the file up to which it has read.
+"""
+
+from __future__ import print_function
+
+import glob
+import json
+import os
+import time
+
+
+TELEMETRY_FILE_NAME = 'telemetry.jsonl'
+
+# The fields of a sample
+SAMPLE_COLUMNS = ['time', 'tbcoverage_bytes', 'tbcoverage_files', 'stats']
+
+# Size of the end of run.stats read to find its last row
+RUN_STATS_TAIL_SIZE = 16 * 1024
+
+# Maximum size of the samples returned by each read
+MAX_READ_SIZE = 256 * 1024
+
+
+def parse_stats_line(line):
+    """
+    Parses a row of run.stats, either comma-separated values or a tuple like `('Instructions', ...)`.
+    Numbers are converted, the other values are kept as strings.
+    """
+    values = []
+    for value in line.strip().strip('()').split(','):
+        value = value.strip().strip('\'"')
+        try:
+            values.append(int(value))
+        except ValueError:
+            try:
+                values.append(float(value))
+            except ValueError:
+                values.append(value)
+
+    return values
+
+
+def read_run_stats(path):
+    """
+    Returns the last row of a run.stats file as a dictionary keyed by the names in its header,
+    or None if it has no row yet.
+    """
+    try:
+        with open(path, 'r') as stats_file:
+            header = stats_file.readline()
+            header_end = stats_file.tell()
+
+            stats_file.seek(0, os.SEEK_END)
+            stats_file.seek(max(header_end, stats_file.tell() - RUN_STATS_TAIL_SIZE))
+            # The last line may still be written
+            lines = [line for line in stats_file.read().split('\n')[:-1] if line.strip()]
+    except (IOError, OSError):
+        return None
+
+    if not header.strip() or not lines:
+        return None
+
+    names = parse_stats_line(header)
+    values = parse_stats_line(lines[-1])
+    if len(names) != len(values):
+        return None
+
+    return dict(zip([str(name) for name in names], values))
+
+
+class TelemetrySampler(object):
+    """
+    Samples the progress of a running analysis.
+    """
+
+    def __init__(self, s2e_out_dir, log_dir):
+        self.s2e_out_dir = s2e_out_dir
+        self.file_path = os.path.join(log_dir, TELEMETRY_FILE_NAME)
+        self.start_time = time.time()
+        self._last_stats = None
+
+        if not os.path.isdir(log_dir):
+            os.makedirs(log_dir)
+
+    def sample(self):
+        """
+        Appends a sample of the current stats and coverage files.
+        """
+        tb_coverage_files = glob.glob(os.path.join(self.s2e_out_dir, '*', 'tbcoverage-*.json')) + \
+                            glob.glob(os.path.join(self.s2e_out_dir, 'tbcoverage-*.json'))
+        tb_coverage_bytes = 0
+        for path in tb_coverage_files:
+            try:
+                tb_coverage_bytes += os.path.getsize(path)
+            except OSError:
+                pass
+
+        stats = read_run_stats(os.path.join(self.s2e_out_dir, 'run.stats'))
+        changed_stats = stats if stats != self._last_stats else None
+        if stats is not None:
+            self._last_stats = stats
+
+        sample = [round(time.time() - self.start_time, 1), tb_coverage_bytes, len(tb_coverage_files), changed_stats]
+        try:
+            with open(self.file_path, 'a') as telemetry_file:
+                telemetry_file.write(json.dumps(sample, separators=(',', ':')) + '\n')
+        except (IOError, OSError) as err:
+            print('WARN: Failed to write the telemetry of %s: %s' % (self.s2e_out_dir, err))
+
+
+def read_samples(log_dir, cursor, max_size=MAX_READ_SIZE):
+    """
+    Reads the samples written after the cursor.
+
+    Returns the samples and the cursor to read from next.
+    """
+    try:
+        with open(os.path.join(log_dir, TELEMETRY_FILE_NAME), 'r') as telemetry_file:
+            telemetry_file.seek(cursor)
+            data = telemetry_file.read(max_size)
+    except (IOError, OSError):
+        return [], cursor
+
+    # Only return the complete samples, the last one may still be written
+    end = data.rfind('\n') + 1
+    samples = []
+    for line in data[:end].split('\n'):
+        if line:
+            try:
+                samples.append(json.loads(line))
+            except ValueError:
+                print('WARN: Skipping a corrupted telemetry sample in %s' % log_dir)
+
+    return samples, cursor + end
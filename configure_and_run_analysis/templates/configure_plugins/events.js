@@ -26,11 +26,6 @@ $(document).ready(function(){
 		}
 
 		if(is_form_valid == true){
-			$("#countdown_label").html($("#timeout_value").val())
-			$("#countdown_label").show();
-			$("#countdown_label_descr").show();
-			timer = setInterval(decrease_countdown, 1000);
-
 			parse_and_post_data();
 		}
 
@@ -46,6 +41,34 @@ $(document).ready(function(){
 
 });
 
+/**
+ * Shows the position of the analysis in the queue of the server
+ * @param position the number of analyses started before this one
+ * @returns
+ */
+function display_queue_position(position){
+	$("#countdown_label_descr").html("Queued, position : ");
+	$("#countdown_label").html(position + 1);
+	$("#countdown_label").show();
+	$("#countdown_label_descr").show();
+}
+
+/**
+ * Starts the countdown of the timeout once the analysis runs
+ * @returns
+ */
+function start_countdown(){
+	if(timer != undefined){
+		return;
+	}
+
+	$("#countdown_label_descr").html("Timeout in : ");
+	$("#countdown_label").html($("#timeout_value").val())
+	$("#countdown_label").show();
+	$("#countdown_label_descr").show();
+	timer = setInterval(decrease_countdown, 1000);
+}
+
 function decrease_countdown(){
 	var countdown_label = $("#countdown_label");
 
@@ -1,5 +1,14 @@
 var unique_id = 0;
 var is_analysis_launched = false;
+// Interval (in ms) at which the status of a running analysis is polled
+var JOB_POLL_INTERVAL = 2000;
+// Number of characters of the console output shown while an analysis runs
+var CONSOLE_OUTPUT_MAX_LENGTH = 100000;
+var console_offset = 0;
+var telemetry_cursor = 0;
+// Time (in s since the start of the analysis) at which the coverage files last grew
+var last_coverage_growth = 0;
+var last_coverage_bytes = 0;
 
 /**
  * Generate a div with the options for the given plugin
@@ -414,13 +423,9 @@ function parse_and_post_data(){
 			processData: false,
 			contentType: false,
 			success: function(data){
-				display_data_from_server(JSON.parse(data));
+				poll_analysis_job(JSON.parse(data).job_id);
 			},
-			error: function(data){
-				alert("error " + data.status + ": " + data.responseText);
-				$('html,body').css('cursor','auto');
-				is_analysis_launched = false;
-			}
+			error: analysis_failed
 		});
 
 		is_analysis_launched = true;
@@ -428,6 +433,120 @@ function parse_and_post_data(){
 
 }
 
+/**
+ * Polls the status of a queued analysis until it is done, then displays its result
+ * @param job_id the id of the analysis job
+ * @returns
+ */
+function poll_analysis_job(job_id){
+	$.ajax({
+		type: "GET",
+		url: "jobs/" + job_id + "/",
+		success: function(data){
+			var job = JSON.parse(data);
+
+			if(job.status == "done"){
+				$.ajax({
+					type: "GET",
+					url: "jobs/" + job_id + "/result/",
+					success: function(data){
+						display_data_from_server(JSON.parse(data));
+					},
+					error: analysis_failed
+				});
+			}
+			else if(job.status == "failed"){
+				analysis_failed({status: 500, responseText: job.error});
+			}
+			else{
+				if(job.status == "queued"){
+					display_queue_position(job.position);
+				}
+				else{
+					start_countdown();
+					tail_console_output(job_id);
+					poll_telemetry(job_id);
+				}
+				setTimeout(function(){ poll_analysis_job(job_id); }, JOB_POLL_INTERVAL);
+			}
+		},
+		error: analysis_failed
+	});
+}
+
+/**
+ * Appends the console output of the running analysis written since the last call
+ * @param job_id the id of the analysis job
+ * @returns
+ */
+function tail_console_output(job_id){
+	$.ajax({
+		type: "GET",
+		url: "jobs/" + job_id + "/console/",
+		data: {offset: console_offset},
+		success: function(data){
+			var output = JSON.parse(data);
+			var console_output = $("#console_output");
+
+			if(output.data.length > 0){
+				console_output.show();
+				console_output.append(document.createTextNode(output.data));
+
+				// Only keep the end of the output in the page
+				var text = console_output.text();
+				if(text.length > CONSOLE_OUTPUT_MAX_LENGTH){
+					console_output.text(text.substring(text.length - CONSOLE_OUTPUT_MAX_LENGTH));
+				}
+				console_output.scrollTop(console_output[0].scrollHeight);
+			}
+			console_offset = output.next_offset;
+		}
+	});
+}
+
+/**
+ * Shows the progress of the running analysis from the telemetry samples written since the last call
+ * @param job_id the id of the analysis job
+ * @returns
+ */
+function poll_telemetry(job_id){
+	$.ajax({
+		type: "GET",
+		url: "jobs/" + job_id + "/telemetry/",
+		data: {cursor: telemetry_cursor},
+		success: function(data){
+			var telemetry = JSON.parse(data);
+			var time_index = telemetry.columns.indexOf("time");
+			var bytes_index = telemetry.columns.indexOf("tbcoverage_bytes");
+
+			if(telemetry.samples.length == 0){
+				return;
+			}
+
+			for(var i = 0; i < telemetry.samples.length; ++i){
+				var sample = telemetry.samples[i];
+				if(sample[bytes_index] != last_coverage_bytes){
+					last_coverage_bytes = sample[bytes_index];
+					last_coverage_growth = sample[time_index];
+				}
+			}
+			telemetry_cursor = telemetry.cursor;
+
+			// A run whose coverage does not grow anymore may be stuck
+			var last_sample = telemetry.samples[telemetry.samples.length - 1];
+			$("#telemetry_label").html(" Coverage : " + Math.round(last_coverage_bytes / 1024) + " KiB, last grew " +
+					Math.round(last_sample[time_index] - last_coverage_growth) + " s ago");
+			$("#telemetry_label").show();
+		}
+	});
+}
+
+function analysis_failed(data){
+	alert("error " + data.status + ": " + data.responseText);
+	$('html,body').css('cursor','auto');
+	is_analysis_launched = false;
+}
+
 /**
  * Gets the full json tree of current configuration
  * @returns the json tree
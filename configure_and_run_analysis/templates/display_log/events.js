@@ -34,16 +34,14 @@ $(document).ready(function(){
     });
 
     $("#graph_img_select").change(function(){
-    	var jquery_this = $(this);
-    	var image_display = $("#image_display");
-
-        image_display.attr("src", jquery_this.val());
+    	display_function_graph($(this).find("option:selected"));
     });
 
     $("#backButton").click(function(){
     	window.location.href = "../";
     });
 
+	display_function_graph($("#graph_img_select option:selected"));
 	display_stats(window.data_runstats);
 	display_icount(window.data_icount);
 
@@ -62,6 +60,156 @@ function resizeIframe(obj) {
 }
 
 
+/**
+ * Displays the graph of the function of the selected option. The control flow graph is
+ * laid out in the browser, the server-side SVG is only used for the analyses without one.
+ */
+function display_function_graph(option){
+	if(option.length === 0){
+		return;
+	}
+
+	var cfg_display = $("#cfg_display");
+	var image_display = $("#image_display");
+
+	$.getJSON(option.val()).done(function(cfg){
+		image_display.hide().removeAttr("src");
+		cfg_display.html(render_cfg(cfg)).show();
+	}).fail(function(){
+		cfg_display.hide().empty();
+		image_display.attr("src", option.data("svg")).show();
+	});
+}
+
+var CFG_BLOCK_WIDTH = 140;
+var CFG_BLOCK_HEIGHT = 30;
+var CFG_HORIZONTAL_GAP = 40;
+var CFG_VERTICAL_GAP = 50;
+var CFG_EDGE_COLORS = {"true": "green", "false": "red", "unconditional": "blue"};
+
+/**
+ * Lays out a control flow graph in layers, in breadth-first order from the function's
+ * entry block, and draws it as an SVG element. Executed blocks are coloured green.
+ */
+function render_cfg(cfg){
+	var svg_ns = "http://www.w3.org/2000/svg";
+	var blocks = {};
+	var successors = {};
+
+	for (var i = 0; i < cfg.blocks.length; ++i){
+		blocks[cfg.blocks[i][0]] = {addr: cfg.blocks[i][0], covered: cfg.blocks[i][2] == 1, layer: -1};
+		successors[cfg.blocks[i][0]] = [];
+	}
+	for (var i = 0; i < cfg.edges.length; ++i){
+		if(cfg.edges[i][0] in blocks && cfg.edges[i][1] in blocks){
+			successors[cfg.edges[i][0]].push(cfg.edges[i][1]);
+		}
+	}
+
+	// Assign every block to a layer, the blocks unreachable from the entry
+	// block start new layers of their own
+	var addrs = Object.keys(blocks).map(Number).sort(function(a, b){ return a - b; });
+	if(cfg.addr in blocks){
+		addrs.unshift(cfg.addr);
+	}
+	var layers = [];
+	var first_layer = 0;
+	for (var i = 0; i < addrs.length; ++i){
+		if(blocks[addrs[i]].layer != -1){
+			continue;
+		}
+
+		blocks[addrs[i]].layer = first_layer;
+		var queue = [addrs[i]];
+		while(queue.length > 0){
+			var block = blocks[queue.shift()];
+			(layers[block.layer] = layers[block.layer] || []).push(block);
+
+			for (var j = 0; j < successors[block.addr].length; ++j){
+				var successor = blocks[successors[block.addr][j]];
+				if(successor.layer == -1){
+					successor.layer = block.layer + 1;
+					queue.push(successor.addr);
+				}
+			}
+		}
+		first_layer = layers.length;
+	}
+
+	var width = 0;
+	for (var i = 0; i < layers.length; ++i){
+		width = Math.max(width, layers[i].length * (CFG_BLOCK_WIDTH + CFG_HORIZONTAL_GAP));
+	}
+	var height = layers.length * (CFG_BLOCK_HEIGHT + CFG_VERTICAL_GAP);
+
+	for (var i = 0; i < layers.length; ++i){
+		var offset = (width - layers[i].length * (CFG_BLOCK_WIDTH + CFG_HORIZONTAL_GAP)) / 2;
+		for (var j = 0; j < layers[i].length; ++j){
+			layers[i][j].x = offset + j * (CFG_BLOCK_WIDTH + CFG_HORIZONTAL_GAP) + CFG_HORIZONTAL_GAP / 2;
+			layers[i][j].y = i * (CFG_BLOCK_HEIGHT + CFG_VERTICAL_GAP) + CFG_VERTICAL_GAP / 2;
+		}
+	}
+
+	var svg = document.createElementNS(svg_ns, "svg");
+	svg.setAttribute("width", width);
+	svg.setAttribute("height", height);
+
+	var defs = document.createElementNS(svg_ns, "defs");
+	for (var kind in CFG_EDGE_COLORS){
+		var marker = document.createElementNS(svg_ns, "marker");
+		marker.setAttribute("id", "cfg_arrow_" + kind);
+		marker.setAttribute("markerWidth", 10);
+		marker.setAttribute("markerHeight", 10);
+		marker.setAttribute("refX", 10);
+		marker.setAttribute("refY", 5);
+		marker.setAttribute("orient", "auto");
+		var arrow = document.createElementNS(svg_ns, "path");
+		arrow.setAttribute("d", "M0,0 L10,5 L0,10 z");
+		arrow.setAttribute("fill", CFG_EDGE_COLORS[kind]);
+		marker.appendChild(arrow);
+		defs.appendChild(marker);
+	}
+	svg.appendChild(defs);
+
+	for (var i = 0; i < cfg.edges.length; ++i){
+		var source = blocks[cfg.edges[i][0]];
+		var target = blocks[cfg.edges[i][1]];
+		if(!source || !target){
+			continue;
+		}
+
+		var line = document.createElementNS(svg_ns, "line");
+		line.setAttribute("x1", source.x + CFG_BLOCK_WIDTH / 2);
+		line.setAttribute("y1", source.y + CFG_BLOCK_HEIGHT);
+		line.setAttribute("x2", target.x + CFG_BLOCK_WIDTH / 2);
+		line.setAttribute("y2", target.y);
+		line.setAttribute("stroke", CFG_EDGE_COLORS[cfg.edges[i][2]]);
+		line.setAttribute("marker-end", "url(#cfg_arrow_" + cfg.edges[i][2] + ")");
+		svg.appendChild(line);
+	}
+
+	for (var addr in blocks){
+		var block = blocks[addr];
+		var rect = document.createElementNS(svg_ns, "rect");
+		rect.setAttribute("x", block.x);
+		rect.setAttribute("y", block.y);
+		rect.setAttribute("width", CFG_BLOCK_WIDTH);
+		rect.setAttribute("height", CFG_BLOCK_HEIGHT);
+		rect.setAttribute("fill", block.covered ? "#50d131" : "gray");
+		rect.setAttribute("stroke", "black");
+		svg.appendChild(rect);
+
+		var label = document.createElementNS(svg_ns, "text");
+		label.setAttribute("x", block.x + CFG_BLOCK_WIDTH / 2);
+		label.setAttribute("y", block.y + CFG_BLOCK_HEIGHT / 2 + 5);
+		label.setAttribute("text-anchor", "middle");
+		label.appendChild(document.createTextNode("0x" + block.addr.toString(16)));
+		svg.appendChild(label);
+	}
+
+	return svg;
+}
+
 /**
  * Displays the statistics in a table.
  */
@@ -114,14 +262,20 @@ function display_icount(icount){
 		var th2 = document.createElement('th')
 		th2.appendChild(document.createTextNode("Instruction count"));
 
+		var th3 = document.createElement('th')
+		th3.appendChild(document.createTextNode("Trace records"));
+
 		tr.appendChild(th1);
 		tr.appendChild(th2);
+		tr.appendChild(th3);
 
 		table.appendChild(tr);
 
 		// table content
+		var trace_states = window.data_trace_summary ? window.data_trace_summary.states : {};
 		for(var state_id in icount){
-			appendElementsToTable(table, [state_id, icount[state_id]]);
+			var records = trace_states[state_id] ? trace_states[state_id].records : "";
+			appendElementsToTable(table, [state_id, icount[state_id], records]);
 		}
 
 		$("#icount").html(table);
@@ -18,4 +18,5 @@ function display_data_from_server(data){
 
 	window.data_runstats = data.stats;
 	window.data_icount = data.icount;
+	window.data_trace_summary = data.trace_summary;
 }
\ No newline at end of file
@@ -4,4 +4,10 @@ from . import views
 
 urlpatterns = [
     url(r'^$', handleRequest),
+    url(r'^function_graph/(?P<path>.+\.svg)$', views.function_graph, name='function_graph'),
+    url(r'^function_cfg/(?P<path>.+\.svg)$', views.function_cfg, name='function_cfg'),
+    url(r'^jobs/(?P<job_id>\d+)/$', views.job_status, name='job_status'),
+    url(r'^jobs/(?P<job_id>\d+)/result/$', views.job_result, name='job_result'),
+    url(r'^jobs/(?P<job_id>\d+)/console/$', views.job_console, name='job_console'),
+    url(r'^jobs/(?P<job_id>\d+)/telemetry/$', views.job_telemetry, name='job_telemetry'),
 ]
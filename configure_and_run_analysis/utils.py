@@ -1,3 +1,6 @@
+import hashlib
+
+
 def write_string_to_disk_and_close(path, string):
     """
     Write a string to the given path and close the file.
@@ -17,3 +20,30 @@ def write_file_to_disk_and_close(path, w_file):
             destination.write(chunk)
     destination.close()
     w_file.close()
+
+
+def file_checksum(path):
+    """
+    Computes the SHA-256 checksum of a file.
+    """
+    return hash_bytestr_iter(file_as_blockiter(open(path, 'rb')), hashlib.sha256())
+
+
+def hash_bytestr_iter(bytesiter, hasher):
+    """
+    Hash the block iterator with the given hasher.
+    """
+    for block in bytesiter:
+        hasher.update(block)
+    return hasher.hexdigest()
+
+
+def file_as_blockiter(afile, blocksize=65536):
+    """
+    Gets te block iterator of a file
+    """
+    with afile:
+        block = afile.read(blocksize)
+        while block:
+            yield block
+            block = afile.read(blocksize)
@@ -1,18 +1,18 @@
 from __future__ import print_function
 
 import json
-import hashlib
 import os
+import tempfile
 
 from django.shortcuts import render
 from django.http import HttpResponseServerError, HttpResponse, HttpResponseBadRequest
 from django.utils.encoding import smart_text
 
-from configure_and_run_analysis.launch_s2e import launch_s2e, create_new_s2e_project
-from configure_and_run_analysis import models, utils
+from configure_and_run_analysis.launch_s2e import create_new_s2e_project
+from configure_and_run_analysis import console_log, jobs, models, scheduler, telemetry, utils
 from configure_and_run_analysis.models import S2ELaunchException
-from configure_and_run_analysis.extract_basic_blocks import generate_graph
-from display_all_analysis.models import Analysis
+from configure_and_run_analysis.extract_basic_blocks import get_function_cfg, get_function_graph
+from display_all_analysis.models import Analysis, AnalysisJob
 from s2e_web import S2E_settings
 import learn_plugin.learn_plugin
 
@@ -47,6 +47,9 @@ def handleRequest(request):
         with open(S2E_settings.S2E_PLUGIN_JSON_CONFIG_FILE, "r") as jsonFile:
             plugins = json.load(jsonFile)
 
+    # Resume the jobs queued before the server was restarted
+    jobs.start_workers()
+
     if request.method == 'POST':
         if request.POST["method"] == "get_config":
             return handle_get_config_request(request, plugins)
@@ -97,36 +100,41 @@ def handle_run_s2e_request(request, plugins):
         if not os.path.exists(S2E_settings.S2E_BINARY_FOLDER_PATH):
             os.makedirs(S2E_settings.S2E_BINARY_FOLDER_PATH)
 
-        utils.write_file_to_disk_and_close(binary_path, request.FILES["binary_file"])
+        # The project uses the binary at binary_path, which must not change under its queued and
+        # running jobs, so the upload is only moved there once it is known to be allowed
+        upload_fd, upload_path = tempfile.mkstemp(prefix='.%s.' % project_name, dir=S2E_settings.S2E_BINARY_FOLDER_PATH)
+        os.close(upload_fd)
 
-        create_error = 0
-        if not os.path.isdir(project_path):
-            create_error = create_new_s2e_project(binary_path)
+        try:
+            utils.write_file_to_disk_and_close(upload_path, request.FILES["binary_file"])
+            binary_checksum = utils.file_checksum(upload_path)
 
-        if create_error != 0:
-            return HttpResponseBadRequest("Unable to create a project with the given binary")
+            selectedPluginsConfig = json.loads(request.POST["data"])
+            selectedPlugins = getSelectedPlugins(selectedPluginsConfig)
 
-        s2e_num = find_next_analysis_num(project_name)
+            configFileContent = generateConfigFileString(selectedPlugins, selectedPluginsConfig, project_name)
 
-        selectedPluginsConfig = json.loads(request.POST["data"])
-        selectedPlugins = getSelectedPlugins(selectedPluginsConfig)
+            with jobs.project_lock(project_name):
+                if jobs.active_binary_checksums(project_name) - {binary_checksum}:
+                    return HttpResponseBadRequest("An analysis of another version of %s is queued or running, "
+                                                  "wait for it to finish" % project_name)
 
-        configFileContent = generateConfigFileString(selectedPlugins, selectedPluginsConfig, project_name)
-        utils.write_string_to_disk_and_close(os.path.join(S2E_settings.S2E_PROJECT_FOLDER_PATH, project_name,
-                                                          "s2e-config.lua"), configFileContent)
+                os.rename(upload_path, binary_path)
 
-        has_s2e_error, killed_by_timeout = launch_s2e(timeout, project_name)
-        add_entry_to_database(s2e_num, project_name, binary_path)
+                create_error = 0
+                if not os.path.isdir(project_path):
+                    create_error = create_new_s2e_project(binary_path)
 
-        s2e_output_dir = os.path.join(S2E_settings.S2E_PROJECT_FOLDER_PATH, project_name, "s2e-out-%d" % s2e_num)
+                if create_error != 0:
+                    return HttpResponseBadRequest("Unable to create a project with the given binary")
 
-        models.generate_lcov_files(s2e_output_dir, project_name)
-        function_paths = generate_graph(s2e_output_dir, s2e_num, project_name)
+                # S2E runs in the background, the page polls the job until its result can be displayed
+                job = jobs.submit(project_name, binary_checksum, configFileContent, timeout)
+        finally:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
 
-        custom_data = models.CustomAnalysisData(killed_by_timeout, has_s2e_error, function_paths)
-        custom_data.save_to_disk(s2e_output_dir)
-
-        return render_output(s2e_output_dir, custom_data.data, s2e_num, project_name, request)
+        return HttpResponse(json.dumps({"job_id": job.id}))
 
     except AttributeError as err:
         print(err)
@@ -148,6 +156,129 @@ def displayAnalysisInDir(request, dir_num, binary_name):
     return render_output(s2e_output_dir, custom_data.data, dir_num, binary_name, request)
 
 
+def job_status(request, job_id):
+    """
+    Serve the status of an analysis job as JSON.
+    """
+    try:
+        job = AnalysisJob.objects.get(pk=job_id)
+    except AnalysisJob.DoesNotExist:
+        return HttpResponse(status=404)
+
+    status = {"status": job.status, "error": job.error, "s2e_num": job.s2e_num}
+    if job.status == AnalysisJob.QUEUED:
+        status["position"] = scheduler.queue_position(job)
+
+    return HttpResponse(json.dumps(status))
+
+
+def job_result(request, job_id):
+    """
+    Render the analysis of a finished job.
+    """
+    try:
+        job = AnalysisJob.objects.get(pk=job_id)
+    except AnalysisJob.DoesNotExist:
+        return HttpResponse(status=404)
+
+    if job.status != AnalysisJob.DONE:
+        return HttpResponseBadRequest("The analysis is not finished")
+
+    return displayAnalysisInDir(request, job.s2e_num, job.project_name)
+
+
+def job_console(request, job_id):
+    """
+    Serve the console output of an analysis job from the offset given in the request, as JSON.
+    The output is read from the log written while S2E runs.
+    """
+    try:
+        job = AnalysisJob.objects.get(pk=job_id)
+        offset = int(request.GET.get("offset", 0))
+    except AnalysisJob.DoesNotExist:
+        return HttpResponse(status=404)
+    except ValueError:
+        return HttpResponseBadRequest("The offset must be an integer")
+
+    if job.s2e_num is None:
+        return HttpResponse(json.dumps({"data": "", "offset": offset, "next_offset": offset}))
+
+    data, start_offset, next_offset = console_log.read_log(console_log.console_log_dir(job.project_name, job.s2e_num),
+                                                           offset)
+
+    return HttpResponse(json.dumps({"data": data.decode("utf-8", "replace"),
+                                    "offset": start_offset,
+                                    "next_offset": next_offset}))
+
+
+def job_telemetry(request, job_id):
+    """
+    Serve the telemetry samples of an analysis job written after the cursor given in the request,
+    as JSON (see `telemetry`).
+    """
+    try:
+        job = AnalysisJob.objects.get(pk=job_id)
+        cursor = int(request.GET.get("cursor", 0))
+    except AnalysisJob.DoesNotExist:
+        return HttpResponse(status=404)
+    except ValueError:
+        return HttpResponseBadRequest("The cursor must be an integer")
+
+    samples = []
+    if job.s2e_num is not None:
+        samples, cursor = telemetry.read_samples(console_log.console_log_dir(job.project_name, job.s2e_num), cursor)
+
+    return HttpResponse(json.dumps({"columns": telemetry.SAMPLE_COLUMNS,
+                                    "samples": samples,
+                                    "cursor": cursor}))
+
+
+def function_graph(request, path):
+    """
+    Serve the SVG graph of a function, given its path relative to the project folder.
+    The graph is rendered the first time it is requested.
+    """
+    functions_dir = get_functions_dir(path)
+    if not functions_dir:
+        return HttpResponse(status=404)
+
+    svg_path = get_function_graph(functions_dir, os.path.basename(path))
+    if not svg_path:
+        return HttpResponse(status=404)
+
+    with open(svg_path, 'rb') as svg:
+        return HttpResponse(svg.read(), content_type='image/svg+xml')
+
+
+def function_cfg(request, path):
+    """
+    Serve the control flow graph of a function as JSON, given the path of its SVG graph
+    relative to the project folder. The graph is laid out and coloured by the browser.
+    """
+    functions_dir = get_functions_dir(path)
+    if not functions_dir:
+        return HttpResponse(status=404)
+
+    cfg = get_function_cfg(functions_dir, os.path.basename(path))
+    if not cfg:
+        return HttpResponse(status=404)
+
+    return HttpResponse(json.dumps(cfg, separators=(',', ':')), content_type='application/json')
+
+
+def get_functions_dir(path):
+    """
+    Gets the functions directory of an analysis from the path of a function graph relative
+    to the project folder, or None if the path is outside of the project folder.
+    """
+    projects_path = os.path.realpath(S2E_settings.S2E_PROJECT_FOLDER_PATH)
+    functions_dir = os.path.realpath(os.path.join(projects_path, os.path.dirname(path)))
+    if not functions_dir.startswith(projects_path + os.sep) or os.path.basename(functions_dir) != 'functions':
+        return None
+
+    return functions_dir
+
+
 def getSelectedPlugins(request_data):
     """
     Gets all the plugin configurations from the request data
@@ -349,7 +480,10 @@ def render_output(s2e_output_dir, custom_data, s2e_num, project_name, request):
     output = models.S2EOutput(s2e_output_dir)
     stats = models.generate_stats(s2e_output_dir)
     has_coverage, line_coverage_path = models.get_lcov_path(s2e_output_dir, s2e_num, project_name)
-    icount = models.generate_icount_files(s2e_output_dir)
+    coverage = models.get_coverage_summaries(s2e_output_dir, find_binary_checksum(s2e_num, project_name))
+    trace_aggregates = models.generate_trace_aggregates(s2e_output_dir)
+    icount = models.generate_icount_files(s2e_output_dir, trace_aggregates)
+    trace_summary = models.get_trace_summary(s2e_output_dir)
 
     print(icount)
 
@@ -358,6 +492,7 @@ def render_output(s2e_output_dir, custom_data, s2e_num, project_name, request):
                             'debug': smart_text(output.debug, encoding="utf-8", errors="ignore"),
                             'line_coverage_exist': has_coverage,
                             'line_coverage_report_path': line_coverage_path,
+                            'coverage': coverage,
                             'custom_data': custom_data}
 
     #The html_page contains the content in the header, hence the 39 first characters must be removed
@@ -365,48 +500,17 @@ def render_output(s2e_output_dir, custom_data, s2e_num, project_name, request):
 
     return HttpResponse(json.dumps({"stats": smart_text(stats, encoding="utf-8", errors="ignore"),
                                     "html":  html_page[39:],
-                                    "icount": icount}))
+                                    "icount": icount,
+                                    "trace_aggregates": trace_aggregates,
+                                    "trace_summary": trace_summary,
+                                    "coverage": coverage}))
 
 
 
-def find_next_analysis_num(binary_name):
+def find_binary_checksum(s2e_num, project_name):
     """
-    Finds the next analysis number from the binary project folder
+    Finds the checksum of the binary of an analysis in the Analysis database.
     """
-    s2e_num = -1
-    result_dirs = os.listdir(os.path.join(S2E_settings.S2E_PROJECT_FOLDER_PATH, binary_name))
-    analysis_numbers = [int(name[8:]) for name in result_dirs if name.startswith("s2e-out")]
-    i = 0
-    while s2e_num == -1:
-        if i not in analysis_numbers:
-            s2e_num = i
-        i += 1
+    analysis = Analysis.objects.filter(s2e_num=s2e_num, binary_name=project_name).last()
 
-    return s2e_num
-
-def add_entry_to_database(s2e_num, project_name, binary_path):
-    """
-    Adds an entry to the Analysis database.
-    """
-    cksum = hash_bytestr_iter(file_as_blockiter(open(binary_path, 'rb')), hashlib.sha256())
-
-    a = Analysis(s2e_num=s2e_num, binary_checksum=cksum, binary_name=project_name)
-    a.save()
-
-def hash_bytestr_iter(bytesiter, hasher):
-    """
-    Hash the block iterator with the given hasher.
-    """
-    for block in bytesiter:
-        hasher.update(block)
-    return hasher.hexdigest()
-
-def file_as_blockiter(afile, blocksize=65536):
-    """
-    Gets te block iterator of a file
-    """
-    with afile:
-        block = afile.read(blocksize)
-        while block:
-            yield block
-            block = afile.read(blocksize)
+    return analysis.binary_checksum if analysis else None
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('display_all_analysis', '0006_analysisjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysis',
+            name='wall_time',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='analysis',
+            name='cpu_time',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='analysis',
+            name='peak_rss',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -7,6 +7,36 @@ class Analysis(models.Model):
     s2e_num = models.IntegerField()
     binary_checksum = models.CharField(max_length=256)
     binary_name = models.CharField(max_length=256)
+    # Resources used by the S2E process tree: wall and CPU time in seconds, peak resident memory in bytes
+    wall_time = models.FloatField(null=True)
+    cpu_time = models.FloatField(null=True)
+    peak_rss = models.BigIntegerField(null=True)
 
     def __str__(self):
         return str(self.s2e_num) + ", " + str(self.binary_checksum) + ", " + str(self.binary_name)
+
+
+class AnalysisJob(models.Model):
+    """
+    The analysis job class represent an analysis waiting for, or being run by, a worker of the job queue.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    project_name = models.CharField(max_length=256)
+    binary_checksum = models.CharField(max_length=256)
+    config = models.TextField()
+    timeout = models.IntegerField()
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    s2e_num = models.IntegerField(null=True)
+    error = models.TextField(default='')
+    worker = models.CharField(max_length=256, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return str(self.id) + ", " + str(self.project_name) + ", " + str(self.status)
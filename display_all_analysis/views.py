@@ -6,7 +6,9 @@ from django.shortcuts import render
 
 from display_all_analysis.models import Analysis
 import s2e_web.S2E_settings as settings
+from configure_and_run_analysis import models
 from configure_and_run_analysis.views import displayAnalysisInDir
+from configure_and_run_analysis.console_log import console_log_dir
 
 
 def handleRequest(request):
@@ -23,14 +25,23 @@ def handleRequest(request):
 
             return displayAnalysisInDir(request, s2e_num, binary_name)
         elif request.POST["method"] == "remove":
-            s2e_num = request.POST["s2e_num"]
+            s2e_num = int(request.POST["s2e_num"])
             binary_name = request.POST["binary_name"]
 
-            Analysis.objects.filter(binary_name=binary_name, s2e_num=s2e_num).delete()
+            analyses = Analysis.objects.filter(binary_name=binary_name, s2e_num=s2e_num)
+            binary_checksums = set(analyses.values_list('binary_checksum', flat=True))
+            analyses.delete()
 
             s2e_output_dir_to_delete = os.path.join(settings.S2E_PROJECT_FOLDER_PATH, binary_name,
                                                     's2e-out-%d' % s2e_num)
             shutil.rmtree(s2e_output_dir_to_delete)
+            shutil.rmtree(console_log_dir(binary_name, s2e_num), ignore_errors=True)
+
+            # The coverage of the deleted analysis must not stay in the cumulative coverage
+            for binary_checksum in binary_checksums:
+                models.rebuild_cumulative_coverage(binary_checksum, [
+                    (a.id, os.path.join(settings.S2E_PROJECT_FOLDER_PATH, a.binary_name, 's2e-out-%d' % a.s2e_num))
+                    for a in Analysis.objects.filter(binary_checksum=binary_checksum)])
 
             return HttpResponse(status=200)
 
@@ -11,5 +11,56 @@ S2E_PLUGIN_JSON_CONFIG_FILE =  os.path.join(os.getcwd(), 'result.json')
 S2E_PROJECT_FOLDER_PATH = os.path.join(S2E_ENVIRONMENT_FOLDER_PATH, 'projects')
 S2E_BINARY_FOLDER_PATH = os.path.join(S2E_ENVIRONMENT_FOLDER_PATH, 'binary')
 
+# The radare2 analyses of the binaries, keyed by their SHA-256 checksum
+R2_ANALYSIS_CACHE_PATH = os.path.join(S2E_ENVIRONMENT_FOLDER_PATH, 'r2_cache')
+
+# The coverage of all the analyses of the binaries, keyed by their SHA-256 checksum
+CUMULATIVE_COVERAGE_PATH = os.path.join(S2E_ENVIRONMENT_FOLDER_PATH, 'cumulative_coverage')
+
 EXECUTION_TRACE_PARSER_SCRIPT_PATH = os.path.join(os.getcwd(), 'tools', 'execution_tracer',
                                                   'execution_trace_parser.py')
+
+# Execution traces at least this big (in bytes) are decoded in parallel
+EXECUTION_TRACE_PARALLEL_MIN_SIZE = 256 * 1024 * 1024
+
+# Interval (in seconds) at which a running analysis is monitored
+S2E_MONITOR_INTERVAL = 5
+
+# Time (in seconds) the processes of an analysis have to exit after SIGTERM before they get SIGKILL
+S2E_KILL_GRACE_PERIOD = 10
+
+# The console output of an analysis is kept in S2E_LOG_SEGMENTS files of at
+# most S2E_LOG_SEGMENT_SIZE bytes, the oldest output is dropped
+S2E_LOG_SEGMENT_SIZE = 8 * 1024 * 1024
+S2E_LOG_SEGMENTS = 4
+
+# Maximum size (in bytes) of the console output returned by each request
+S2E_LOG_TAIL_MAX_SIZE = 64 * 1024
+
+# Render all the function graphs after an analysis instead of rendering each
+# one the first time it is viewed
+FUNCTION_GRAPH_PRERENDER = False
+
+# Number of processes prerendering the function graphs (one per core if None)
+FUNCTION_GRAPH_RENDER_PROCESSES = None
+
+# Number of processes parsing the translation block coverage files (one per core if None)
+TB_COVERAGE_PARSE_PROCESSES = None
+
+# Maximum number of analyses run at the same time by each server process,
+# fewer are run if the host does not have the resources for them
+ANALYSIS_WORKERS = 4
+
+# Interval (in seconds) at which the idle analysis workers check the job queue
+ANALYSIS_QUEUE_POLL_INTERVAL = 10
+
+# Order in which the queued analyses are started: 'fifo' or 'shortest_timeout'
+ANALYSIS_QUEUE_ORDER = 'fifo'
+
+# Cores and memory (in bytes) used by an S2E run, an analysis is only started
+# if the host has them left
+S2E_RUN_CORES = 1
+S2E_RUN_MEMORY = 2 * 1024 * 1024 * 1024
+
+# Maximum number of S2E runs at the same time on the host (no limit if None)
+S2E_MAX_RUNS = None
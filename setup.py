@@ -25,6 +25,9 @@ setup(
         'r2pipe',
         's2e-env',
     ],
+    extras_require={
+        'columnar': ['numpy'],
+    },
     classifiers=[
         'Environment :: Web Environment',
         'Framework :: Django',
@@ -0,0 +1,80 @@
+"""
+Compact arrays of unsigned 32 and 64-bit integers (offsets, addresses,
+timestamps, state ids), stored little-endian in the sidecar files of the
+traces and analyses.
+"""
+
+import array
+import sys
+
+
+def _typecode(itemsize, typecodes):
+    """
+    Returns the first of the `array` typecodes whose items have the given size.
+    """
+    for typecode in typecodes:
+        try:
+            if array.array(typecode).itemsize == itemsize:
+                return typecode
+        except ValueError:
+            continue
+
+    raise RuntimeError('No %d-bit array type available' % (8 * itemsize))
+
+
+UINT32_TYPECODE = _typecode(4, ('I', 'L'))
+UINT64_TYPECODE = _typecode(8, ('Q', 'L'))
+
+
+def uint32_array(values=()):
+    """
+    Returns a new array of unsigned 32-bit integers.
+    """
+    return array.array(UINT32_TYPECODE, values)
+
+
+def uint64_array(values=()):
+    """
+    Returns a new array of unsigned 64-bit integers.
+    """
+    return array.array(UINT64_TYPECODE, values)
+
+
+def array_to_bytes(values):
+    """
+    Returns the little-endian bytes of an array.
+    """
+    if sys.byteorder != 'little':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+def array_from_bytes(typecode, data):
+    """
+    Returns the array with the given typecode of little-endian bytes.
+    """
+    values = array.array(typecode)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    return values
+
+
+def uint64_array_to_bytes(values):
+    """
+    Returns the little-endian bytes of an array of unsigned 64-bit integers.
+    """
+    return array_to_bytes(values)
+
+
+def uint64_array_from_bytes(data):
+    """
+    Returns the array of unsigned 64-bit integers of little-endian bytes.
+    """
+    return array_from_bytes(UINT64_TYPECODE, data)
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks of the decoding and aggregation of S2E execution traces.
+
+Synthetic `ExecutionTracer.dat` files of configurable size and entry type mix
+are generated with the `serialize()` methods of the trace entries, so the
+benchmarks run offline without an S2E installation. For each benchmark the
+throughput in records per second, the peak memory and the time to the first
+result are reported.
+
+Usage:
+
+```
+python tools/execution_tracer/benchmark.py --records 1000000 --mix iCount=1,call=2,return=2,memory=5
+```
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue
+
+# Allow the benchmarks to be run as a script from anywhere
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)))
+
+from tools.execution_tracer import execution_trace_parser as execution_parser
+from tools.execution_tracer.structs import *
+
+
+DEFAULT_MIX = 'iCount=1,call=2,return=2,memory=5'
+DEFAULT_NUM_STATES = 16
+
+# Builds a random entry of each supported type
+ENTRY_FACTORIES = {
+    TraceEntryType.TRACE_MOD_LOAD: lambda rand: TraceModuleLoad(b'module', b'/path/to/module', 0x400000, 0x400000,
+                                                                0x1000, 0, rand.randint(1, 100)),
+    TraceEntryType.TRACE_MOD_UNLOAD: lambda rand: TraceModuleUnload(0x400000),
+    TraceEntryType.TRACE_CALL: lambda rand: TraceCall(rand.getrandbits(32), rand.getrandbits(32)),
+    TraceEntryType.TRACE_RET: lambda rand: TraceReturn(rand.getrandbits(32), rand.getrandbits(32)),
+    TraceEntryType.TRACE_FORK: lambda rand: TraceFork(rand.getrandbits(32), [rand.randint(0, 100), rand.randint(0, 100)]),
+    TraceEntryType.TRACE_BRANCHCOV: lambda rand: TraceBranchCoverage(rand.getrandbits(32), rand.getrandbits(32)),
+    TraceEntryType.TRACE_MEMORY: lambda rand: TraceMemory(rand.getrandbits(32), rand.getrandbits(32),
+                                                          rand.getrandbits(32), 4, 0, rand.getrandbits(32), 0),
+    TraceEntryType.TRACE_PAGEFAULT: lambda rand: TracePageFault(rand.getrandbits(32), rand.getrandbits(32), 0),
+    TraceEntryType.TRACE_TLBMISS: lambda rand: TraceTLBMiss(rand.getrandbits(32), rand.getrandbits(32), 1),
+    TraceEntryType.TRACE_ICOUNT: lambda rand: TraceICount(rand.getrandbits(32)),
+    TraceEntryType.TRACE_EXCEPTION: lambda rand: TraceException(rand.getrandbits(32), rand.randint(0, 31)),
+    TraceEntryType.TRACE_STATE_SWITCH: lambda rand: TraceStateSwitch(rand.randint(0, DEFAULT_NUM_STATES)),
+    TraceEntryType.TRACE_BLOCK: lambda rand: TraceBlock(rand.getrandbits(32), rand.getrandbits(32), 0),
+}
+
+ENTRY_TYPES_BY_NAME = dict((name, entry_type) for entry_type, name in execution_parser.ENTRY_NAMES.items()
+                           if entry_type in ENTRY_FACTORIES)
+
+
+def parse_mix(mix):
+    """
+    Parses an entry type mix such as `iCount=1,memory=5` into a list of
+    `(entry type, weight)` tuples.
+    """
+    weights = []
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ENTRY_TYPES_BY_NAME:
+            raise ValueError('Unknown entry type %s, expected one of %s' %
+                             (name, ', '.join(sorted(ENTRY_TYPES_BY_NAME))))
+        weights.append((ENTRY_TYPES_BY_NAME[name], float(weight or 1)))
+
+    return weights
+
+
+def generate_trace(path, num_records, mix, num_states=DEFAULT_NUM_STATES, seed=0):
+    """
+    Writes a synthetic execution trace of `num_records` records to `path`.
+    The entry types are drawn from `mix`, a list of `(entry type, weight)`
+    tuples.
+    """
+    rand = random.Random(seed)
+    entry_types = [entry_type for entry_type, _ in mix]
+    total_weight = sum(weight for _, weight in mix)
+    cumulative_weights = []
+    for _, weight in mix:
+        cumulative_weights.append((cumulative_weights[-1] if cumulative_weights else 0) + weight / total_weight)
+
+    with open(path, 'wb') as f:
+        for timestamp in range(num_records):
+            draw = rand.random()
+            entry_type = entry_types[-1]
+            for candidate_type, cumulative_weight in zip(entry_types, cumulative_weights):
+                if draw < cumulative_weight:
+                    entry_type = candidate_type
+                    break
+
+            data = ENTRY_FACTORIES[entry_type](rand).serialize()
+            header = TraceItemHeader(timestamp, len(data), entry_type, rand.randint(0, num_states - 1), 1)
+            f.write(header.serialize())
+            f.write(data)
+
+
+def _setup_django(scratch_dir):
+    """
+    Configures the settings needed to import the analysis models without an
+    S2E environment.
+    """
+    os.environ.setdefault('S2E_ENV_PATH', scratch_dir)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 's2e_web.settings')
+
+    from configure_and_run_analysis import models
+
+    return models
+
+
+def bench_read(trace_path, scratch_dir):
+    results = execution_parser.S2ETraceParser(trace_path).read()
+    return len(results), None
+
+
+def bench_iter_entries(trace_path, scratch_dir):
+    num_records = 0
+    first_result_time = None
+    for _ in execution_parser.S2ETraceParser(trace_path).iter_entries():
+        if first_result_time is None:
+            first_result_time = time.time()
+        num_records += 1
+
+    return num_records, first_result_time
+
+
+def bench_main(trace_path, scratch_dir):
+    return len(execution_parser.main(trace_path)), None
+
+
+def bench_generate_icount_files(trace_path, scratch_dir):
+    models = _setup_django(scratch_dir)
+
+    # Benchmark a cold start, without any index or cache from a previous run
+    out_dir = tempfile.mkdtemp(dir=scratch_dir)
+    os.symlink(os.path.abspath(trace_path), os.path.join(out_dir, 'ExecutionTracer.dat'))
+    models.generate_icount_files(out_dir)
+
+    return None, None
+
+
+BENCHMARKS = [
+    ('S2ETraceParser.read', bench_read),
+    ('S2ETraceParser.iter_entries', bench_iter_entries),
+    ('execution_parser.main', bench_main),
+    ('generate_icount_files', bench_generate_icount_files),
+]
+
+
+def _run_in_child(benchmark, trace_path, scratch_dir, queue):
+    try:
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start_time = time.time()
+        num_records, first_result_time = benchmark(trace_path, scratch_dir)
+        end_time = time.time()
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        queue.put({
+            'time': end_time - start_time,
+            'first_result': (first_result_time or end_time) - start_time,
+            'num_records': num_records,
+            'peak_memory_kb': max(0, peak_rss - start_rss),
+        })
+    except Exception as err:
+        queue.put({'error': '%s: %s' % (type(err).__name__, err)})
+
+
+def run_benchmark(benchmark, trace_path, scratch_dir):
+    """
+    Runs a benchmark in a fresh process, so that its peak memory is not
+    hidden by the ones that ran before it.
+
+    Note that the peak memory includes the pages of the trace that are
+    memory-mapped by the parser.
+    """
+    queue = Queue()
+    process = Process(target=_run_in_child, args=(benchmark, trace_path, scratch_dir, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    return result
+
+
+def parse_args():
+    """Parse command-line arguments."""
+
+    parser = argparse.ArgumentParser(description='Benchmark the decoding of S2E execution traces')
+    parser.add_argument('--records', type=int, default=100000,
+                        help='Number of records of the synthetic trace')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='Weighted entry type mix, e.g. %s' % DEFAULT_MIX)
+    parser.add_argument('--states', type=int, default=DEFAULT_NUM_STATES,
+                        help='Number of states of the synthetic trace')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each benchmark, the fastest one is reported')
+    parser.add_argument('--trace', help='Benchmark an existing trace instead of a synthetic one')
+    parser.add_argument('--only', action='append', choices=[name for name, _ in BENCHMARKS],
+                        help='Only run the given benchmark (can be repeated)')
+
+    return parser.parse_args()
+
+
+def main():
+    """The main function."""
+
+    args = parse_args()
+    scratch_dir = tempfile.mkdtemp(prefix='s2e-trace-bench-')
+
+    try:
+        trace_path = args.trace
+        if not trace_path:
+            trace_path = os.path.join(scratch_dir, 'ExecutionTracer.dat')
+            start_time = time.time()
+            generate_trace(trace_path, args.records, parse_mix(args.mix), args.states)
+            print('Generated %d records (%.1f MiB) in %.1fs' %
+                  (args.records, os.path.getsize(trace_path) / 1048576.0, time.time() - start_time))
+
+        num_records = sum(1 for _ in execution_parser.S2ETraceParser(trace_path).iter_record_headers())
+
+        print('%-30s %12s %14s %14s %14s' % ('benchmark', 'time (s)', 'records/s', 'first (s)', 'peak mem (MiB)'))
+        for name, benchmark in BENCHMARKS:
+            if args.only and name not in args.only:
+                continue
+
+            results = [run_benchmark(benchmark, trace_path, scratch_dir) for _ in range(args.repeat)]
+            errors = [result['error'] for result in results if 'error' in result]
+            if errors:
+                print('%-30s failed: %s' % (name, errors[0]))
+                continue
+
+            best = min(results, key=lambda result: result['time'])
+            print('%-30s %12.3f %14.0f %14.3f %14.1f' %
+                  (name, best['time'], num_records / best['time'] if best['time'] else float('inf'),
+                   best['first_result'], max(result['peak_memory_kb'] for result in results) / 1024.0))
+    finally:
+        shutil.rmtree(scratch_dir)
+
+
+if __name__ == '__main__':
+    main()
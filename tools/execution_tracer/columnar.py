@@ -0,0 +1,305 @@
+"""
+Columnar decoding of S2E execution traces.
+
+Instead of building one Python object per trace entry, the entries of each
+type are decoded into a single NumPy structured array. Aggregations over a
+trace can then run at NumPy speed.
+
+You will need to install numpy:
+
+```
+pip install numpy
+```
+"""
+
+from __future__ import print_function
+
+import mmap
+import os
+import re
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from execution_trace_parser import S2ETraceParser, S2ETraceParserException
+from structs import *
+
+
+HAS_NUMPY = np is not None
+
+# Number of records gathered from the trace buffer at once
+CHUNK_SIZE = 1 << 16
+
+# The header fields that are kept in every array, with their offset in the
+# `TraceItemHeader` struct
+HEADER_COLUMNS = (
+    ('timestamp', 'Q', 0),
+    ('stateId', 'I', 13),
+    ('pid', 'Q', 17),
+)
+
+# The names of the fields of each statically sized entry, in `FORMAT` order.
+# The names match the keys returned by the entries' `as_dict`
+ENTRY_COLUMNS = {
+    TraceEntryType.TRACE_MOD_LOAD: ('name', 'path', 'loadBase', 'nativeBase', 'size', 'addressSpace', 'pid'),
+    TraceEntryType.TRACE_MOD_UNLOAD: ('loadBase',),
+    TraceEntryType.TRACE_PROC_UNLOAD: (),
+    TraceEntryType.TRACE_CALL: ('source', 'target'),
+    TraceEntryType.TRACE_RET: ('source', 'target'),
+    TraceEntryType.TRACE_BRANCHCOV: ('pc', 'destPc'),
+    TraceEntryType.TRACE_MEMORY: ('pc', 'address', 'value', 'size', 'flags', 'hostAddress', 'concreteBuffer'),
+    TraceEntryType.TRACE_PAGEFAULT: ('pc', 'address', 'isWrite'),
+    TraceEntryType.TRACE_TLBMISS: ('pc', 'address', 'isWrite'),
+    TraceEntryType.TRACE_ICOUNT: ('count',),
+    TraceEntryType.TRACE_EXCEPTION: ('pc', 'vector'),
+    TraceEntryType.TRACE_STATE_SWITCH: ('newStateId',),
+    TraceEntryType.TRACE_BLOCK: ('startPc', 'endPc', 'tbType'),
+}
+
+_FORMAT_TOKEN = re.compile(r'(\d*)([a-zA-Z?])')
+
+_NUMPY_CODES = {
+    'b': 'i1', 'B': 'u1', '?': 'b1',
+    'h': 'i2', 'H': 'u2',
+    'i': 'i4', 'I': 'u4', 'l': 'i4', 'L': 'u4',
+    'q': 'i8', 'Q': 'u8',
+    'f': 'f4', 'd': 'f8',
+}
+
+
+def _format_fields(fmt):
+    """
+    Splits a little-endian struct format into a list of
+    `(numpy type, offset)` tuples, one per field.
+    """
+    if not fmt.startswith('<'):
+        raise ValueError('Only little-endian formats are supported: %s' % fmt)
+
+    fields = []
+    prefix = '<'
+    for count, code in _FORMAT_TOKEN.findall(fmt[1:]):
+        offset = struct.calcsize(prefix)
+        prefix += count + code
+
+        if code == 'x':
+            continue
+        elif code == 's':
+            fields.append(('S%d' % int(count or 1), offset))
+        elif code in _NUMPY_CODES:
+            numpy_type = '<' + _NUMPY_CODES[code]
+            if count and int(count) != 1:
+                numpy_type = (numpy_type, (int(count),))
+            fields.append((numpy_type, offset))
+        else:
+            raise ValueError('Unsupported struct format code %s in %s' % (code, fmt))
+
+    return fields
+
+
+def record_dtype(entry_type):
+    """
+    Builds the NumPy dtype of a whole record (header followed by entry) of
+    the given type.
+
+    As with the JSON output of the parser, an entry field hides the header
+    field with the same name.
+    """
+    entry_cls = S2ETraceParser.ENTRY_CLASSES[entry_type]
+    entry_names = ENTRY_COLUMNS[entry_type]
+    entry_fields = _format_fields(entry_cls.FORMAT)
+    if len(entry_names) != len(entry_fields):
+        raise ValueError('%s has %d fields but %d column names' %
+                         (entry_cls.__name__, len(entry_fields), len(entry_names)))
+
+    header_size = TraceItemHeader.static_size()
+    names, formats, offsets = [], [], []
+
+    for name, code, offset in HEADER_COLUMNS:
+        if name not in entry_names:
+            names.append(name)
+            formats.append('<' + _NUMPY_CODES[code])
+            offsets.append(offset)
+
+    for name, (numpy_type, offset) in zip(entry_names, entry_fields):
+        names.append(name)
+        formats.append(numpy_type)
+        offsets.append(header_size + offset)
+
+    return np.dtype({
+        'names': names,
+        'formats': formats,
+        'offsets': offsets,
+        'itemsize': header_size + entry_cls.static_size(),
+    })
+
+
+def _index_records(buf, entry_types):
+    """
+    Walks the record headers of the trace and returns the offsets of the
+    records of each wanted type, without decoding any entry.
+    """
+    buf_size = len(buf)
+    header_size = TraceItemHeader.static_size()
+    unpack_header = TraceItemHeader._struct.unpack_from
+    offsets = {}
+    offset = 0
+
+    if entry_types is not None:
+        entry_types = frozenset(entry_types)
+
+    while offset < buf_size:
+        if offset + header_size > buf_size:
+            raise S2ETraceParserException('Truncated trace item header at '
+                                          'offset %d' % offset)
+
+        _, size, data_type, _, _ = unpack_header(buf, offset)
+        if offset + header_size + size > buf_size:
+            raise S2ETraceParserException('Truncated trace entry of type '
+                                          '%d at offset %d' %
+                                          (data_type, offset + header_size))
+
+        # As in `S2ETraceParser`, unwanted records are skipped without
+        # checking their type
+        if entry_types is not None and data_type not in entry_types:
+            offset += header_size + size
+            continue
+
+        if not S2ETraceParser.ENTRY_CLASSES.get(data_type):
+            raise S2ETraceParserException('The header type %d does not '
+                                          'have a corresponding entry '
+                                          'class' % data_type)
+
+        if data_type in ENTRY_COLUMNS:
+            if size < S2ETraceParser.ENTRY_CLASSES[data_type].static_size():
+                raise S2ETraceParserException('Trace entry of type %d at '
+                                              'offset %d is too short' %
+                                              (data_type, offset + header_size))
+            offsets.setdefault(data_type, []).append(offset)
+
+        offset += header_size + size
+
+    return offsets
+
+
+def _gather(raw, offsets, dtype):
+    """
+    Copies the records starting at the given offsets into a structured array.
+    """
+    out = np.empty(len(offsets), dtype=dtype)
+    out_bytes = out.view(np.uint8).reshape(len(offsets), dtype.itemsize)
+    record_range = np.arange(dtype.itemsize)
+
+    for start in range(0, len(offsets), CHUNK_SIZE):
+        chunk = offsets[start:start + CHUNK_SIZE]
+        out_bytes[start:start + len(chunk)] = raw[chunk[:, None] + record_range]
+
+    return out
+
+
+def _indexed_records(index, entry_types):
+    """
+    Returns the offsets of the records of each wanted type from a
+    `TraceIndex`, with the same checks as `_index_records`.
+    """
+    offsets = {}
+
+    for data_type, type_offsets in index.type_offsets.items():
+        if entry_types is not None and data_type not in entry_types:
+            continue
+
+        if not S2ETraceParser.ENTRY_CLASSES.get(data_type):
+            raise S2ETraceParserException('The header type %d does not '
+                                          'have a corresponding entry '
+                                          'class' % data_type)
+
+        if data_type in ENTRY_COLUMNS and len(type_offsets):
+            offsets[data_type] = type_offsets
+
+    return offsets
+
+
+def _check_sizes(entries, entry_type):
+    """
+    Checks that none of the decoded entries is shorter than its static size.
+    """
+    header_bytes = entries.view(np.uint8).reshape(len(entries), entries.dtype.itemsize)
+    sizes = header_bytes[:, 8:12].copy().view('<u4').ravel()
+    too_short = np.nonzero(sizes < S2ETraceParser.ENTRY_CLASSES[entry_type].static_size())[0]
+    if len(too_short):
+        raise S2ETraceParserException('Trace entry of type %d number %d is too short' %
+                                      (entry_type, too_short[0]))
+
+
+def decode_columns(filename, entry_types=None, index=None):
+    """
+    Decodes an S2E execution trace file into one NumPy structured array per
+    `TraceEntryType`.
+
+    Each array holds the `timestamp`, `stateId` and `pid` header fields
+    followed by the entry fields, in file order. Only the types in
+    `entry_types` are decoded when it is given. Entries whose size cannot be
+    determined statically are skipped, as in `S2ETraceParser`.
+
+    The record offsets are taken from `index`, a `TraceIndex` of the trace,
+    instead of scanning the trace if it is given.
+
+    Returns a dictionary mapping each entry type to its array.
+    """
+    if not HAS_NUMPY:
+        raise S2ETraceParserException('NumPy is required for columnar trace decoding')
+
+    with open(filename, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return {}
+
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if index is not None:
+                record_offsets = _indexed_records(index, entry_types)
+            else:
+                record_offsets = _index_records(buf, entry_types)
+
+            raw = np.frombuffer(buf, dtype=np.uint8)
+            columns = {}
+            for entry_type, offsets in record_offsets.items():
+                dtype = record_dtype(entry_type)
+                columns[entry_type] = _gather(raw, np.array(offsets, dtype=np.int64), dtype)
+                if index is not None:
+                    _check_sizes(columns[entry_type], entry_type)
+
+            # The mmap cannot be closed while NumPy still references it
+            del raw
+        finally:
+            buf.close()
+
+    return columns
+
+
+def last_value_per_state(entries, field):
+    """
+    Returns a `{state id: value}` dictionary holding the last value of
+    `field` seen for every state.
+    """
+    if not len(entries):
+        return {}
+
+    # np.unique returns the index of the first occurrence, so search the
+    # entries backwards to get the last one
+    state_ids, indexes = np.unique(entries['stateId'][::-1], return_index=True)
+    values = entries[field][::-1][indexes]
+
+    return dict(zip(state_ids.tolist(), values.tolist()))
+
+
+def decreasing_values(values):
+    """
+    Returns the values that are smaller than the value preceding them.
+    """
+    values = np.asarray(values)
+    if len(values) < 2:
+        return values[:0]
+
+    return values[1:][values[1:] < values[:-1]]
@@ -32,16 +32,13 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 from __future__ import print_function
 
 import argparse
-import struct
+import mmap
+import os
 import sys
 
 from structs import *
 
 
-class S2ETraceParserException(Exception):
-    pass
-
-
 class S2ETraceParser(object):
     """Parses an S2E execution trace file."""
 
@@ -75,45 +72,245 @@ class S2ETraceParser(object):
         Creates a new S2E execution trace parser based on the given trace file.
         """
         self._file = open(filename, 'rb')
+        self._mmap = None
+        self._remap()
+
+        # Offset of the first record that has not been returned by `poll` yet
+        self.resume_offset = 0
+
+    def _remap(self):
+        """
+        Maps the whole trace file in memory, picking up any data appended
+        since the last mapping.
+        """
+        size = os.fstat(self._file.fileno()).st_size
+        if self._mmap is not None:
+            if len(self._mmap) == size:
+                return
+            self._mmap.close()
+            self._mmap = None
+
+        # mmap cannot map an empty file, in which case there is nothing to
+        # iterate over anyway
+        if size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
 
     def __del__(self):
-        self._file.close()
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
 
-    def read(self):
+    def __iter__(self):
+        return self.iter_entries()
+
+    def iter_record_headers(self):
         """
-        Parses the S2E binary execution trace file and returns a list of
-        `(trace entry header, trace entry)` tuples.
+        Yields an `(offset, header fields)` tuple for every record in the
+        trace, reading only the record headers. The header fields are in
+        `TraceItemHeader.FORMAT` order.
         """
-        results = []
+        if self._mmap is None:
+            return
+
+        buf = self._mmap
+        buf_size = len(buf)
+        header_size = TraceItemHeader.static_size()
+        unpack_header = TraceItemHeader._struct.unpack_from
+        offset = 0
+
+        while offset < buf_size:
+            if offset + header_size > buf_size:
+                raise S2ETraceParserException('Truncated trace item header at '
+                                              'offset %d' % offset)
+
+            header_fields = unpack_header(buf, offset)
+            next_offset = offset + header_size + header_fields[1]
+            if next_offset > buf_size:
+                raise S2ETraceParserException('Truncated trace entry at offset '
+                                              '%d' % (offset + header_size))
+
+            yield offset, header_fields
+            offset = next_offset
+
+    def iter_entries(self, entry_types=None, start=0, end=None, index_builder=None):
+        """
+        Lazily parses the S2E binary execution trace file, yielding one
+        `(trace entry header, trace entry)` tuple at a time.
 
-        while True:
-            raw_header = self._file.read(TraceItemHeader.static_size())
+        The trace is memory-mapped and each record is decoded in place, so
+        memory usage does not depend on the size of the trace.
 
-            # An empty header signifies EOF
-            if not raw_header:
-                break
+        If `entry_types` is given, only the entries of these
+        `TraceEntryType`s are decoded. The body of every other record is
+        skipped using the size in its header, without being unpacked.
+
+        `start` and `end` restrict parsing to a byte range of the trace. They
+        must fall on record boundaries (see `iter_record_headers`).
 
-            unpacked_header = struct.unpack(TraceItemHeader.FORMAT, raw_header)
-            header = TraceItemHeader(*unpacked_header)
+        Every record, decoded or not, is added to `index_builder`, a
+        `TraceIndexBuilder`, if given.
+        """
+        if self._mmap is None:
+            return
+
+        if entry_types is not None:
+            entry_types = frozenset(entry_types)
+
+        buf = self._mmap
+        buf_size = len(buf) if end is None else min(end, len(buf))
+        header_size = TraceItemHeader.static_size()
+        unpack_header = TraceItemHeader._struct.unpack_from
+        offset = start
+
+        # An offset at the end of the buffer signifies EOF
+        while offset < buf_size:
+            if offset + header_size > buf_size:
+                raise S2ETraceParserException('Truncated trace item header at '
+                                              'offset %d' % offset)
+
+            header_fields = unpack_header(buf, offset)
+            data_size = header_fields[1]
+            data_type = header_fields[2]
+            if index_builder is not None:
+                index_builder.add(offset, data_type, header_fields[3], header_fields[0])
+            offset += header_size
+
+            if offset + data_size > buf_size:
+                raise S2ETraceParserException('Truncated trace entry of type '
+                                              '%d at offset %d' %
+                                              (data_type, offset))
+
+            if entry_types is not None and data_type not in entry_types:
+                offset += data_size
+                continue
 
             # Determine what the next blob of data is from the header's type
-            data_type = header.type
             entry_cls = S2ETraceParser.ENTRY_CLASSES.get(data_type)
             if not entry_cls:
                 raise S2ETraceParserException('The header type %d does not '
                                               'have a corresponding entry '
                                               'class' % data_type)
-            raw_data = self._file.read(header.size)
-            if entry_cls.FORMAT is not None:
-                # The struct format can be determined statically
-                unpacked_data = struct.unpack(entry_cls.FORMAT, raw_data)
-                data = entry_cls(*unpacked_data)
-                results.append((header, data))
+
+            if entry_cls.is_decodable():
+                yield TraceItemHeader(*header_fields), entry_cls.unpack_from(buf, offset, data_size)
             else:
-                # TODO The struct format needs to be determined dynamically
+                # TODO The struct format of the entry is not known yet
                 pass
 
-        return results
+            offset += data_size
+
+    def iter_entries_at(self, offsets):
+        """
+        Lazily decodes the records starting at the given offsets, e.g. taken
+        from a `TraceIndex`, yielding `(trace entry header, trace entry)`
+        tuples.
+        """
+        if self._mmap is None:
+            return
+
+        buf = self._mmap
+        buf_size = len(buf)
+        header_size = TraceItemHeader.static_size()
+
+        for offset in offsets:
+            if offset + header_size > buf_size:
+                raise S2ETraceParserException('Truncated trace item header at '
+                                              'offset %d' % offset)
+
+            header = TraceItemHeader.unpack_from(buf, offset)
+            offset += header_size
+
+            entry_cls = S2ETraceParser.ENTRY_CLASSES.get(header.type)
+            if not entry_cls:
+                raise S2ETraceParserException('The header type %d does not '
+                                              'have a corresponding entry '
+                                              'class' % header.type)
+            if offset + header.size > buf_size:
+                raise S2ETraceParserException('Truncated trace entry of type '
+                                              '%d at offset %d' %
+                                              (header.type, offset))
+
+            if entry_cls.is_decodable():
+                yield header, entry_cls.unpack_from(buf, offset, header.size)
+
+    def _complete_records_end(self, start):
+        """
+        Returns the end offset of the last complete record after `start`,
+        ignoring a partially written record at the end of the trace.
+        """
+        buf = self._mmap
+        buf_size = len(buf)
+        header_size = TraceItemHeader.static_size()
+        unpack_header = TraceItemHeader._struct.unpack_from
+        offset = start
+
+        while offset + header_size <= buf_size:
+            next_offset = offset + header_size + unpack_header(buf, offset)[1]
+            if next_offset > buf_size:
+                break
+            offset = next_offset
+
+        return offset
+
+    def poll(self, entry_types=None):
+        """
+        Resumable parsing of a trace that is still being written.
+
+        Yields the `(trace entry header, trace entry)` tuples of the complete
+        records appended since the previous call, and leaves a partially
+        written record at the end of the trace for the next call. The
+        `resume_offset` is only advanced once all the records have been
+        consumed. See `iter_entries` for `entry_types`.
+        """
+        self._remap()
+        if self._mmap is None:
+            return
+
+        start = self.resume_offset
+        end = self._complete_records_end(start)
+        for header, entry in self.iter_entries(entry_types, start, end):
+            yield header, entry
+
+        self.resume_offset = end
+
+    def read(self):
+        """
+        Parses the S2E binary execution trace file and returns a list of
+        `(trace entry header, trace entry)` tuples.
+
+        Prefer `iter_entries` for large traces.
+        """
+        return list(self.iter_entries())
+
+
+# Maps each trace entry type to its name in the JSON output
+ENTRY_NAMES = {
+    TraceEntryType.TRACE_MOD_LOAD: 'moduleLoad',
+    TraceEntryType.TRACE_MOD_UNLOAD: 'moduleUnload',
+    TraceEntryType.TRACE_PROC_UNLOAD: 'processUnload',
+    TraceEntryType.TRACE_CALL: 'call',
+    TraceEntryType.TRACE_RET: 'return',
+    TraceEntryType.TRACE_TB_START: '',
+    TraceEntryType.TRACE_TB_END: '',
+    TraceEntryType.TRACE_MODULE_DESC: '',
+    TraceEntryType.TRACE_FORK: 'fork',
+    TraceEntryType.TRACE_CACHESIM: '',
+    TraceEntryType.TRACE_TESTCASE: 'testCase',
+    TraceEntryType.TRACE_BRANCHCOV: 'branchCoverage',
+    TraceEntryType.TRACE_MEMORY: 'memory',
+    TraceEntryType.TRACE_PAGEFAULT: 'pageFault',
+    TraceEntryType.TRACE_TLBMISS: 'tlbMiss',
+    TraceEntryType.TRACE_ICOUNT: 'iCount',
+    TraceEntryType.TRACE_MEM_CHECKER: 'memChecker',
+    TraceEntryType.TRACE_EXCEPTION: 'exception',
+    TraceEntryType.TRACE_STATE_SWITCH: 'stateSwitch',
+    TraceEntryType.TRACE_TB_START_X64: '',
+    TraceEntryType.TRACE_TB_END_X64: '',
+    TraceEntryType.TRACE_BLOCK: 'block',
+}
+
 
 def _merge_dicts(a, b):
     """Merge two dictionaries."""
@@ -134,42 +331,25 @@ def parse_args():
     return parser.parse_args()
 
 
+def iter_json_entries(log_file, entry_types=None):
+    """
+    Lazily yields each entry of the given trace file as a
+    `{entry name: entry dict}` dictionary.
+
+    Only the entries of the given `entry_types` are yielded, if specified.
+    """
+    log_reader = S2ETraceParser(log_file)
+    for h, d in log_reader.iter_entries(entry_types):
+        yield {ENTRY_NAMES[h.type]: _merge_dicts(h.as_dict(), d.as_dict())}
+
+
 def main(argument):
     """The main function."""
 
-    entry_classes = {
-        TraceEntryType.TRACE_MOD_LOAD: 'moduleLoad',
-        TraceEntryType.TRACE_MOD_UNLOAD: 'moduleUnload',
-        TraceEntryType.TRACE_PROC_UNLOAD: 'processUnload',
-        TraceEntryType.TRACE_CALL: 'call',
-        TraceEntryType.TRACE_RET: 'return',
-        TraceEntryType.TRACE_TB_START: '',
-        TraceEntryType.TRACE_TB_END: '',
-        TraceEntryType.TRACE_MODULE_DESC: '',
-        TraceEntryType.TRACE_FORK: 'fork',
-        TraceEntryType.TRACE_CACHESIM: '',
-        TraceEntryType.TRACE_TESTCASE: 'testCase',
-        TraceEntryType.TRACE_BRANCHCOV: 'branchCoverage',
-        TraceEntryType.TRACE_MEMORY: 'memory',
-        TraceEntryType.TRACE_PAGEFAULT: 'pageFault',
-        TraceEntryType.TRACE_TLBMISS: 'tlbMiss',
-        TraceEntryType.TRACE_ICOUNT: 'iCount',
-        TraceEntryType.TRACE_MEM_CHECKER: 'memChecker',
-        TraceEntryType.TRACE_EXCEPTION: 'exception',
-        TraceEntryType.TRACE_STATE_SWITCH: 'stateSwitch',
-        TraceEntryType.TRACE_TB_START_X64: '',
-        TraceEntryType.TRACE_TB_END_X64: '',
-        TraceEntryType.TRACE_BLOCK: 'block',
-    }
-
     args = argparse.Namespace(log_file=argument)
 
     try:
-        log_reader = S2ETraceParser(args.log_file)
-        results = log_reader.read()
-        json_results = [{entry_classes[h.type]: _merge_dicts(h.as_dict(), d.as_dict())} for h, d in results]
-
-        return json_results
+        return list(iter_json_entries(args.log_file))
     except S2ETraceParserException as e:
         print('ERROR: %s' % e)
 
@@ -0,0 +1,99 @@
+"""
+Parallel decoding of S2E execution traces.
+
+A header-only pass splits the trace into record-aligned shards, which are
+then decoded and reduced by a pool of processes. The caller merges the
+partial results, which are returned in trace order.
+"""
+
+from __future__ import print_function
+
+import multiprocessing
+import os
+
+from execution_trace_parser import S2ETraceParser
+
+
+# Number of shards created per process, so that a slow shard does not hold
+# up the whole pool
+SHARDS_PER_PROCESS = 4
+
+
+def _record_offsets(filename, index_builder=None):
+    """
+    Yields the offset of every record of the trace, adding the records to
+    `index_builder`, a `TraceIndexBuilder`, if given.
+    """
+    for offset, (timestamp, _, entry_type, state_id, _) in S2ETraceParser(filename).iter_record_headers():
+        if index_builder is not None:
+            index_builder.add(offset, entry_type, state_id, timestamp)
+        yield offset
+
+
+def split_shards(filename, num_shards, index=None, index_builder=None):
+    """
+    Splits the trace into at most `num_shards` `(start, end)` byte ranges of
+    roughly equal size. Every range starts and ends on a record boundary.
+
+    If a `TraceIndex` of the trace is given, the ranges are cut at its
+    checkpoints instead of scanning the record headers. Otherwise the scanned
+    records are added to `index_builder`, a `TraceIndexBuilder`, if given.
+    """
+    file_size = os.path.getsize(filename)
+    if not file_size:
+        return []
+
+    if index is not None:
+        record_offsets = index.checkpoint_offsets
+    else:
+        record_offsets = _record_offsets(filename, index_builder)
+
+    shard_size = max(1, file_size // num_shards)
+    boundaries = [0]
+    next_cut = shard_size
+
+    for offset in record_offsets:
+        if offset >= next_cut:
+            boundaries.append(offset)
+            next_cut = offset + shard_size
+
+    boundaries.append(file_size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _map_shard(args):
+    """
+    Decodes a single shard in a worker process and reduces it with `mapper`.
+    """
+    filename, start, end, mapper, entry_types = args
+    log_reader = S2ETraceParser(filename)
+
+    return mapper(log_reader.iter_entries(entry_types, start, end))
+
+
+def map_shards(filename, mapper, entry_types=None, processes=None, index=None, index_builder=None):
+    """
+    Reduces every shard of the trace with `mapper` in a process pool.
+
+    `mapper` receives an iterator over the `(header, entry)` tuples of a
+    shard and must be a module-level function so that it can be sent to the
+    worker processes. Only the entries of the given `entry_types` are
+    decoded, if specified. The shards are cut using `index`, a `TraceIndex`
+    of the trace, if given, or added to `index_builder` while they are cut.
+
+    Returns the list of partial results, in trace order.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    shards = split_shards(filename, processes * SHARDS_PER_PROCESS, index, index_builder)
+    tasks = [(filename, start, end, mapper, entry_types) for start, end in shards]
+
+    if len(tasks) <= 1 or processes == 1:
+        return [_map_shard(task) for task in tasks]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_map_shard, tasks)
+    finally:
+        pool.close()
+        pool.join()
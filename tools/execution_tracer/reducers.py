@@ -0,0 +1,220 @@
+"""
+Single-pass aggregations over S2E execution traces.
+
+A reducer subscribes to a set of entry types and folds the matching entries
+into a result. Any number of reducers can be run together in one pass over
+the trace, either serially or on parallel shards of the trace (see
+`parallel`), so adding a new statistic does not add a new parse.
+"""
+
+from __future__ import print_function
+
+import functools
+
+import parallel
+from execution_trace_parser import ENTRY_NAMES, S2ETraceParser
+from structs import *
+
+
+class TraceReducer(object):
+    """
+    Abstract trace reducer.
+
+    Subclasses define the `NAME` of their result and the `ENTRY_TYPES` they
+    subscribe to.
+    """
+
+    NAME = None
+    ENTRY_TYPES = ()
+
+    def reduce(self, header, entry):
+        """
+        Folds a `(header, entry)` pair of one of the subscribed types.
+        """
+        raise NotImplementedError()
+
+    def merge(self, other):
+        """
+        Folds the reducer of the shard that follows this one in the trace.
+        """
+        raise NotImplementedError()
+
+    def result(self):
+        """
+        Returns the result of the reduction, as a dictionary.
+        """
+        raise NotImplementedError()
+
+
+class InstructionCountReducer(TraceReducer):
+    """
+    Last instruction count of every state.
+
+    The timestamps that are smaller than the one of the previous instruction
+    count entry are recorded in `out_of_order_timestamps`.
+    """
+
+    NAME = 'instruction_count'
+    ENTRY_TYPES = (TraceEntryType.TRACE_ICOUNT,)
+
+    def __init__(self):
+        self.instruction_count = {}
+        self.first_timestamp = None
+        self.last_timestamp = 0
+        self.out_of_order_timestamps = []
+
+    def reduce(self, header, entry):
+        timestamp = header.timestamp
+        self.instruction_count[header.state_id] = entry.count
+
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+        elif timestamp < self.last_timestamp:
+            self.out_of_order_timestamps.append(timestamp)
+
+        self.last_timestamp = timestamp
+
+    def merge(self, other):
+        if other.first_timestamp is None:
+            return
+
+        if self.first_timestamp is None:
+            self.first_timestamp = other.first_timestamp
+        elif other.first_timestamp < self.last_timestamp:
+            self.out_of_order_timestamps.append(other.first_timestamp)
+
+        self.out_of_order_timestamps.extend(other.out_of_order_timestamps)
+        self.instruction_count.update(other.instruction_count)
+        self.last_timestamp = other.last_timestamp
+
+    def result(self):
+        return self.instruction_count
+
+
+class EntryCountReducer(TraceReducer):
+    """
+    Abstract reducer counting the entries by a key computed by `key`.
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def key(self, header, entry):
+        raise NotImplementedError()
+
+    def reduce(self, header, entry):
+        key = self.key(header, entry)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def merge(self, other):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+
+    def result(self):
+        return self.counts
+
+
+class CallReturnCountReducer(EntryCountReducer):
+    """
+    Number of function calls and returns.
+    """
+
+    NAME = 'call_return_count'
+    ENTRY_TYPES = (TraceEntryType.TRACE_CALL, TraceEntryType.TRACE_RET)
+
+    def key(self, header, entry):
+        return ENTRY_NAMES[header.type]
+
+
+class ForkCountReducer(EntryCountReducer):
+    """
+    Number of forks of every state.
+    """
+
+    NAME = 'fork_count'
+    ENTRY_TYPES = (TraceEntryType.TRACE_FORK,)
+
+    def key(self, header, entry):
+        return header.state_id
+
+
+class ExceptionCountReducer(EntryCountReducer):
+    """
+    Number of exceptions of every vector.
+    """
+
+    NAME = 'exception_count'
+    ENTRY_TYPES = (TraceEntryType.TRACE_EXCEPTION,)
+
+    def key(self, header, entry):
+        return entry.vector
+
+
+def subscribed_entry_types(reducers):
+    """
+    Returns the entry types that at least one of the reducers subscribes to.
+    """
+    entry_types = set()
+    for reducer in reducers:
+        entry_types.update(reducer.ENTRY_TYPES)
+
+    return entry_types
+
+
+def run_reducers(entries, reducers):
+    """
+    Feeds every `(header, entry)` pair to the reducers subscribed to its
+    type, in a single pass. Returns the reducers.
+    """
+    subscribers = {}
+    for reducer in reducers:
+        for entry_type in reducer.ENTRY_TYPES:
+            subscribers.setdefault(entry_type, []).append(reducer.reduce)
+
+    for header, entry in entries:
+        for reduce_ in subscribers.get(header.type, ()):
+            reduce_(header, entry)
+
+    return reducers
+
+
+def _reduce_shard(reducer_classes, entries):
+    return run_reducers(entries, [reducer_cls() for reducer_cls in reducer_classes])
+
+
+def reduce_trace(filename, reducer_classes, index=None, index_builder=None):
+    """
+    Runs the given reducer classes over the trace in a single pass, decoding
+    only the entries they subscribe to. The entries are located with
+    `index`, a `TraceIndex` of the trace, if given. Otherwise the records
+    are added to `index_builder`, a `TraceIndexBuilder`, if given.
+
+    Returns the reducers.
+    """
+    reducers = [reducer_cls() for reducer_cls in reducer_classes]
+    entry_types = subscribed_entry_types(reducers)
+    log_reader = S2ETraceParser(filename)
+
+    if index is not None:
+        entries = log_reader.iter_entries_at(index.offsets(entry_types))
+    else:
+        entries = log_reader.iter_entries(entry_types, index_builder=index_builder)
+
+    return run_reducers(entries, reducers)
+
+
+def parallel_reduce_trace(filename, reducer_classes, index=None, processes=None, index_builder=None):
+    """
+    Same as `reduce_trace`, but the shards of the trace are reduced in a
+    process pool before being merged in trace order.
+    """
+    reducers = [reducer_cls() for reducer_cls in reducer_classes]
+    entry_types = subscribed_entry_types(reducers)
+
+    shards = parallel.map_shards(filename, functools.partial(_reduce_shard, reducer_classes),
+                                 entry_types, processes, index, index_builder)
+    for shard_reducers in shards:
+        for reducer, shard_reducer in zip(reducers, shard_reducers):
+            reducer.merge(shard_reducer)
+
+    return reducers
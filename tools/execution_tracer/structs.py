@@ -31,6 +31,10 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import struct
 
 
+class S2ETraceParserException(Exception):
+    pass
+
+
 class TraceEntryType(object):
     """
     The different types of trace entries that can be written to the log.
@@ -67,10 +71,12 @@ class TraceEntry(object):
     Defines how a particular trace entry is serialized to the log.
     """
 
+    __slots__ = ()
+
     FORMAT = None
 
-    def __init__(self, fmt=''):
-        self._struct = struct.Struct(fmt)
+    # Subclasses with a static FORMAT share a precompiled `struct.Struct`
+    _struct = None
 
     def __len__(self):
         return self._struct.size
@@ -88,16 +94,34 @@ class TraceEntry(object):
         else:
             raise ValueError('Cannot statically determine the size of %s' % cls)
 
+    @classmethod
+    def is_decodable(cls):
+        """
+        Returns True if entries of this class can be decoded by `unpack_from`.
+        """
+        return cls.FORMAT is not None
+
+    @classmethod
+    def unpack_from(cls, buf, offset=0, size=None):
+        """
+        Decodes an entry from `buf` at the given offset, without copying the
+        underlying data. `size` is the size of the record given by its
+        header, which variable-size entries must not read past.
+        """
+        return cls(*cls._struct.unpack_from(buf, offset))
+
 
 class TraceItemHeader(TraceEntry):
     """
     The header for a trace entry.
     """
 
+    __slots__ = ('_timestamp', '_size', '_type', '_state_id', '_pid')
+
     FORMAT = '<QIBIQ'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, timestamp, size, type_, state_id, pid):
-        super(TraceItemHeader, self).__init__(TraceItemHeader.FORMAT)
         self._timestamp = timestamp
         self._size = size
         self._type = type_
@@ -146,11 +170,14 @@ class TraceModuleLoad(TraceEntry):
     Serialize a module load event.
     """
 
+    __slots__ = ('_name', '_path', '_load_base', '_native_base', '_size',
+                 '_address_space', '_pid')
+
     FORMAT = '<32s256sQQQQQ'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, name, path, load_base, native_base, size, address_space,
                  pid):
-        super(TraceModuleLoad, self).__init__(TraceModuleLoad.FORMAT)
         self._name = name
         self._path = path
         self._load_base = load_base
@@ -213,10 +240,12 @@ class TraceModuleUnload(TraceEntry):
     Serialize a module unload event.
     """
 
+    __slots__ = ('_load_base',)
+
     FORMAT = '<Q'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, load_base):
-        super(TraceModuleUnload, self).__init__(TraceModuleUnload.FORMAT)
         self._load_base = load_base
 
     def serialize(self):
@@ -237,7 +266,10 @@ class TraceProcessUnload(TraceEntry):
     Serialize a process unload event.
     """
 
+    __slots__ = ()
+
     FORMAT = '<'
+    _struct = struct.Struct(FORMAT)
 
     def serialize(self):
         return ''
@@ -251,10 +283,12 @@ class TraceCall(TraceEntry):
     Serialize a function call event.
     """
 
+    __slots__ = ('_source', '_target')
+
     FORMAT = '<QQ'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, source, target):
-        super(TraceCall, self).__init__(TraceCall.FORMAT)
         self._source = source
         self._target = target
 
@@ -281,10 +315,12 @@ class TraceReturn(TraceEntry):
     Serialize a function return event.
     """
 
+    __slots__ = ('_source', '_target')
+
     FORMAT = '<QQ'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, source, target):
-        super(TraceReturn, self).__init__(TraceReturn.FORMAT)
         self._source = source
         self._target = target
 
@@ -311,11 +347,35 @@ class TraceFork(TraceEntry):
     Serialize a process fork event.
     """
 
+    __slots__ = ('_struct', '_pc', '_state_ids')
+
+    # The fixed-size prefix of the entry, followed by the state ids
+    _PREFIX = struct.Struct('<QI')
+
     def __init__(self, pc, state_ids):
-        super(TraceFork, self).__init__('QI%dI' % len(state_ids))
+        self._struct = struct.Struct('QI%dI' % len(state_ids))
         self._pc = pc
         self._state_ids = state_ids
 
+    @classmethod
+    def is_decodable(cls):
+        return True
+
+    @classmethod
+    def unpack_from(cls, buf, offset=0, size=None):
+        if size is None:
+            size = len(buf) - offset
+        if size < cls._PREFIX.size:
+            raise S2ETraceParserException('Fork entry at offset %d is too short' % offset)
+
+        pc, num_state_ids = cls._PREFIX.unpack_from(buf, offset)
+        if cls._PREFIX.size + 4 * num_state_ids > size:
+            raise S2ETraceParserException('Fork entry at offset %d has %d state ids, more than its '
+                                          'size of %d bytes holds' % (offset, num_state_ids, size))
+        state_ids = struct.unpack_from('<%dI' % num_state_ids, buf, offset + cls._PREFIX.size)
+
+        return cls(pc, list(state_ids))
+
     def serialize(self):
         return self._struct.pack(self._pc,
                                  len(self._state_ids),
@@ -341,10 +401,12 @@ class TraceBranchCoverage(TraceEntry):
     Serialize a branch event.
     """
 
+    __slots__ = ('_pc', '_dest_pc')
+
     FORMAT = '<QQ'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, pc, dest_pc):
-        super(TraceBranchCoverage, self).__init__(TraceBranchCoverage.FORMAT)
         self._pc = pc
         self._dest_pc = dest_pc
 
@@ -376,11 +438,14 @@ class TraceCacheSimType(object):
 
 
 class TraceCacheSimParams(TraceEntry):
+    __slots__ = ('_type', '_cache_id', '_size', '_line_size', '_associativity',
+                 '_upper_cache_id')
+
     FORMAT = '<BIIIII'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, type_, cache_id, size, line_size, associativity,
                  upper_cache_id):
-        super(TraceCacheSimParams, self).__init__(TraceCacheSimParams.FORMAT)
         self._type = type_
         self._cache_id = cache_id
         self._size = size
@@ -432,10 +497,12 @@ class TraceCacheSimParams(TraceEntry):
 
 
 class TraceCacheSimName(TraceEntry):
+    __slots__ = ('_type', '_id', '_length', '_name')
+
     FORMAT = '<BIIs'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, type_, id_, length, name):
-        super(TraceCacheSimName, self).__init__(TraceCacheSimName.FORMAT)
         self._type = type_
         self._id = id_
         self._length = length
@@ -473,11 +540,14 @@ class TraceCacheSimName(TraceEntry):
 
 
 class TraceCacheSimEntry(TraceEntry):
+    __slots__ = ('_type', '_cache_id', '_pc', '_address', '_size', '_is_write',
+                 '_is_code', '_miss_count')
+
     FORMAT = '<BBQQBBBB'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, type_, cache_id, pc, address, size, is_write, is_code,
                  miss_count):
-        super(TraceCacheSimEntry, self).__init__(TraceCacheSimEntry.FORMAT)
         self._type = type_
         self._cache_id = cache_id
         self._pc = pc
@@ -551,10 +621,12 @@ class TraceMemChecker(TraceEntry):
         EXECUTE = 16
         RESOURCE = 32
 
+    __slots__ = ('_start', '_size', '_flags', '_name')
+
     FORMAT = '<QIIIs'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, start, size, flags, name):
-        super(TraceMemChecker, self).__init__(TraceMemChecker.FORMAT)
         self._start = start
         self._size = size
         self._flags = flags
@@ -594,7 +666,7 @@ class TraceMemChecker(TraceEntry):
 
 class TraceTestCase(TraceEntry):
     # TODO
-    pass
+    __slots__ = ()
 
 
 class TraceMemory(TraceEntry):
@@ -602,11 +674,14 @@ class TraceMemory(TraceEntry):
     Serialize a memory access event.
     """
 
+    __slots__ = ('_pc', '_address', '_value', '_size', '_flags',
+                 '_host_address', '_concrete_buffer')
+
     FORMAT = '<QQQBBQQ'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, pc, address, value, size, flags, host_address,
                  concrete_buffer):
-        super(TraceMemory, self).__init__(TraceMemory.FORMAT)
         self._pc = pc
         self._address = address
         self._value = value
@@ -669,10 +744,12 @@ class TracePageFault(TraceEntry):
     Serialize a page fault event.
     """
 
+    __slots__ = ('_pc', '_address', '_is_write')
+
     FORMAT = '<QQB'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, pc, address, is_write):
-        super(TracePageFault, self).__init__(TracePageFault.FORMAT)
         self._pc = pc
         self._address = address
         self._is_write = is_write
@@ -705,10 +782,12 @@ class TraceTLBMiss(TraceEntry):
     Serialize a TLB miss event.
     """
 
+    __slots__ = ('_pc', '_address', '_is_write')
+
     FORMAT = '<QQB'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, pc, address, is_write):
-        super(TraceTLBMiss, self).__init__(TraceTLBMiss.FORMAT)
         self._pc = pc
         self._address = address
         self._is_write = is_write
@@ -741,10 +820,12 @@ class TraceICount(TraceEntry):
     Serialize an instruction count event.
     """
 
+    __slots__ = ('_count',)
+
     FORMAT = '<Q'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, count):
-        super(TraceICount, self).__init__(TraceICount.FORMAT)
         self._count = count
 
     def serialize(self):
@@ -785,11 +866,14 @@ class TraceTranslationBlock(TraceEntry):
         ESI = 6
         EDI = 7
 
+    __slots__ = ('_pc', '_target_pc', '_size', '_tb_size', '_tb_type',
+                 '_symb_mask', '_registers')
+
     FORMAT = '<QQIBB8Q'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, pc, target_pc, size, tb_size, tb_type, symb_mask,
                  registers):
-        super(TraceTranslationBlock, self).__init__(TraceTranslationBlock.FORMAT)
         self._pc = pc
         self._target_pc = target_pc
         self._size = size
@@ -851,10 +935,12 @@ class TraceBlock(TraceEntry):
     Serialize a basic block event.
     """
 
+    __slots__ = ('_start_pc', '_end_pc', '_tb_type')
+
     FORMAT = '<QQB'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, start_pc, end_pc, tb_type):
-        super(TraceBlock, self).__init__(TraceBlock.FORMAT)
         self._start_pc = start_pc
         self._end_pc = end_pc
         self._tb_type = tb_type
@@ -887,10 +973,11 @@ class TraceTranslationBlock64(TraceEntry):
     Serialize a 64-bit translation block event.
     """
 
+    __slots__ = ('_base', '_symb_mask', '_extended_registers')
+
     FORMAT = '<SB8Q'
 
     def __init__(self, base, symb_mask, extended_registers):
-        super(TraceTranslationBlock64, self).__init__(TraceTranslationBlock64.FORMAT)
         self._base = base
         self._symb_mask = symb_mask
         self._extended_registers = extended_registers
@@ -925,10 +1012,12 @@ class TraceException(TraceEntry):
     Serialize an exception event.
     """
 
+    __slots__ = ('_pc', '_vector')
+
     FORMAT = '<QI'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, pc, vector):
-        super(TraceException, self).__init__(TraceException.FORMAT)
         self._pc = pc
         self._vector = vector
 
@@ -955,10 +1044,12 @@ class TraceStateSwitch(TraceEntry):
     Serialize a state switch event.
     """
 
+    __slots__ = ('_new_state_id',)
+
     FORMAT = '<I'
+    _struct = struct.Struct(FORMAT)
 
     def __init__(self, new_state_id):
-        super(TraceStateSwitch, self).__init__(TraceStateSwitch.FORMAT)
         self._new_state_id = new_state_id
 
     def serialize(self):
@@ -0,0 +1,151 @@
+"""
+On-disk cache of decoded S2E execution traces.
+
+The cache lives in a directory next to the trace. It holds the columnar
+arrays of the decoded entries (see `columnar`) as `.npy` files, which are
+memory-mapped when reused, and a manifest with the aggregates derived from
+the trace. Everything is computed on first use and invalidated as soon as
+the size or modification time of the trace changes.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+
+import columnar
+
+
+CACHE_DIR_NAME = 'trace_cache'
+MANIFEST_FILE_NAME = 'manifest.json'
+
+# Bump whenever the layout of the cache changes
+CACHE_VERSION = 1
+
+
+def _write_atomically(path, write):
+    """
+    Writes a file through a temporary file so that a concurrent reader never
+    sees it partially written.
+    """
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            write(f)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    os.rename(tmp_path, path)
+
+
+class TraceCache(object):
+    """
+    Cache of the decoded entries and the aggregates of an execution trace.
+    """
+
+    def __init__(self, trace_path, cache_dir=None):
+        self.trace_path = trace_path
+        self.cache_dir = cache_dir or os.path.join(os.path.dirname(trace_path), CACHE_DIR_NAME)
+        self._manifest = None
+
+    def _manifest_path(self):
+        return os.path.join(self.cache_dir, MANIFEST_FILE_NAME)
+
+    def _column_path(self, entry_type):
+        return os.path.join(self.cache_dir, 'columns_%d.npy' % entry_type)
+
+    def _trace_signature(self):
+        stat = os.stat(self.trace_path)
+        return {'version': CACHE_VERSION, 'trace_size': stat.st_size, 'trace_mtime': stat.st_mtime}
+
+    def _load_manifest(self):
+        """
+        Loads the manifest of the cache, wiping the cache if it is stale.
+        """
+        if self._manifest is not None:
+            return self._manifest
+
+        signature = self._trace_signature()
+        manifest = None
+        try:
+            with open(self._manifest_path(), 'r') as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+
+        if not manifest or manifest.get('signature') != signature:
+            if os.path.isdir(self.cache_dir):
+                shutil.rmtree(self.cache_dir)
+            manifest = {'signature': signature, 'columns': [], 'aggregates': {}}
+
+        self._manifest = manifest
+        return manifest
+
+    def _save_manifest(self):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        data = json.dumps(self._manifest).encode('utf-8')
+        _write_atomically(self._manifest_path(), lambda f: f.write(data))
+
+    def aggregate(self, name, compute):
+        """
+        Returns the aggregate with the given name, computing it with
+        `compute()` and caching it if needed. The aggregate must be JSON
+        serializable.
+        """
+        return self.aggregates([name], lambda names: {name: compute()})[name]
+
+    def aggregates(self, names, compute):
+        """
+        Returns a `{name: aggregate}` dictionary of the aggregates with the
+        given names. The missing ones are computed together by
+        `compute(missing names)`, which returns them as a dictionary, and
+        cached. The aggregates must be JSON serializable.
+        """
+        manifest = self._load_manifest()
+        missing_names = [name for name in names if name not in manifest['aggregates']]
+
+        if missing_names:
+            manifest['aggregates'].update(compute(missing_names))
+            try:
+                self._save_manifest()
+            except (IOError, OSError) as err:
+                print('WARN: Failed to write the trace cache of %s: %s' % (self.trace_path, err))
+
+        return dict((name, manifest['aggregates'][name]) for name in names)
+
+    def columns(self, entry_types, index=None):
+        """
+        Returns the columnar arrays of the given entry types (see
+        `columnar.decode_columns`). Cached arrays are memory-mapped, the
+        others are decoded, with the help of `index` if given, and cached.
+        """
+        manifest = self._load_manifest()
+        cached_types = set(manifest['columns'])
+        missing_types = [t for t in entry_types if t not in cached_types]
+
+        columns = {}
+        if missing_types:
+            columns = columnar.decode_columns(self.trace_path, missing_types, index)
+            try:
+                if not os.path.isdir(self.cache_dir):
+                    os.makedirs(self.cache_dir)
+                for entry_type in missing_types:
+                    if entry_type in columns:
+                        _write_atomically(self._column_path(entry_type),
+                                          lambda f: columnar.np.save(f, columns[entry_type]))
+                    manifest['columns'].append(entry_type)
+                self._save_manifest()
+            except (IOError, OSError) as err:
+                print('WARN: Failed to write the trace cache of %s: %s' % (self.trace_path, err))
+
+        for entry_type in entry_types:
+            path = self._column_path(entry_type)
+            if entry_type not in columns and os.path.exists(path):
+                columns[entry_type] = columnar.np.load(path, mmap_mode='r')
+
+        return columns
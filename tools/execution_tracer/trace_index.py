@@ -0,0 +1,288 @@
+"""
+Persistent offset index of S2E execution traces.
+
+The first pass over a trace (see `reducers.reduce_trace`) collects the offsets
+of its records grouped by entry type, along with the state id of every record,
+as well as periodic timestamp checkpoints, and writes them to a compact binary
+sidecar file next to the trace. Later opens load the sidecar to decode only
+the records they need, e.g. those of some states, or to summarize the trace
+without scanning it. The sidecar is validated against the size and
+modification time of the trace and rebuilt whenever it is stale.
+
+Each offset is stored once, as 8 bytes, and the state ids of the records of a
+type are stored as 4 bytes each in the same order, so the records of a state
+are found without duplicating their offsets in a group of their own. The
+number of records of every state and type is stored as well, so that the
+views summarize a trace without going through all its records.
+"""
+
+from __future__ import print_function
+
+import array
+import heapq
+import os
+import struct
+from collections import Counter
+
+from arrays import UINT32_TYPECODE, UINT64_TYPECODE, array_from_bytes, array_to_bytes, uint32_array, uint64_array
+from execution_trace_parser import S2ETraceParser
+
+
+INDEX_SUFFIX = '.idx'
+
+# Bump whenever the layout of the sidecar file changes
+INDEX_VERSION = 3
+
+# A timestamp checkpoint is recorded every `CHECKPOINT_INTERVAL` records
+CHECKPOINT_INTERVAL = 4096
+
+_MAGIC = b'S2ETIDX\0'
+_FILE_HEADER = struct.Struct('<8sIQdQIQ')
+_GROUP_HEADER = struct.Struct('<QQ')
+_STATE_COUNT = struct.Struct('<IIQ')
+_COUNT = struct.Struct('<Q')
+
+
+def _read_exactly(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise EOFError('Unexpected end of index file')
+
+    return data
+
+
+def _write_array(f, values):
+    f.write(array_to_bytes(values))
+
+
+def _read_array(f, typecode, count):
+    return array_from_bytes(typecode, _read_exactly(f, array.array(typecode).itemsize * count))
+
+
+def index_path(trace_path):
+    """
+    Returns the path of the sidecar index of the given trace.
+    """
+    return trace_path + INDEX_SUFFIX
+
+
+class TraceIndex(object):
+    """
+    Offsets of the records of an execution trace.
+    """
+
+    def __init__(self, trace_size, trace_mtime, record_count, last_timestamp, type_offsets, type_state_ids,
+                 state_counts, checkpoint_offsets, checkpoint_timestamps):
+        self.trace_size = trace_size
+        self.trace_mtime = trace_mtime
+        self.record_count = record_count
+        self.last_timestamp = last_timestamp
+
+        # Entry type -> offsets of the records of that type
+        self.type_offsets = type_offsets
+        # Entry type -> state ids of the records of that type, in the same order
+        self.type_state_ids = type_state_ids
+        # State id -> entry type -> number of records
+        self.state_counts = state_counts
+
+        # Offset and timestamp of every `CHECKPOINT_INTERVAL`th record
+        self.checkpoint_offsets = checkpoint_offsets
+        self.checkpoint_timestamps = checkpoint_timestamps
+
+    @classmethod
+    def load(cls, trace_path):
+        """
+        Loads the sidecar index of a trace.
+
+        Returns `None` if there is no index, or if it is corrupted or stale.
+        """
+        try:
+            stat = os.stat(trace_path)
+            with open(index_path(trace_path), 'rb') as f:
+                magic, version, trace_size, trace_mtime, record_count, checkpoint_interval, last_timestamp = \
+                    _FILE_HEADER.unpack(_read_exactly(f, _FILE_HEADER.size))
+                if (magic != _MAGIC or version != INDEX_VERSION or
+                        checkpoint_interval != CHECKPOINT_INTERVAL or
+                        trace_size != stat.st_size or trace_mtime != stat.st_mtime):
+                    return None
+
+                num_types = _COUNT.unpack(_read_exactly(f, _COUNT.size))[0]
+                type_offsets = {}
+                type_state_ids = {}
+                for _ in range(num_types):
+                    entry_type, count = _GROUP_HEADER.unpack(_read_exactly(f, _GROUP_HEADER.size))
+                    type_offsets[entry_type] = _read_array(f, UINT64_TYPECODE, count)
+                    type_state_ids[entry_type] = _read_array(f, UINT32_TYPECODE, count)
+
+                num_state_counts = _COUNT.unpack(_read_exactly(f, _COUNT.size))[0]
+                state_counts = {}
+                for _ in range(num_state_counts):
+                    state_id, entry_type, count = _STATE_COUNT.unpack(_read_exactly(f, _STATE_COUNT.size))
+                    state_counts.setdefault(state_id, {})[entry_type] = count
+
+                num_checkpoints = _COUNT.unpack(_read_exactly(f, _COUNT.size))[0]
+                checkpoint_offsets = _read_array(f, UINT64_TYPECODE, num_checkpoints)
+                checkpoint_timestamps = _read_array(f, UINT64_TYPECODE, num_checkpoints)
+        except (IOError, OSError, EOFError, struct.error):
+            return None
+
+        return cls(trace_size, trace_mtime, record_count, last_timestamp, type_offsets, type_state_ids,
+                   state_counts, checkpoint_offsets, checkpoint_timestamps)
+
+    @classmethod
+    def open(cls, trace_path):
+        """
+        Loads the sidecar index of a trace, or builds it with a header-only
+        scan and saves it if it is missing or stale.
+        """
+        index = cls.load(trace_path)
+        if index is None:
+            index_builder = TraceIndexBuilder(trace_path)
+            for offset, (timestamp, _, entry_type, state_id, _) in S2ETraceParser(trace_path).iter_record_headers():
+                index_builder.add(offset, entry_type, state_id, timestamp)
+            index = index_builder.finish()
+
+        return index
+
+    def save(self, trace_path):
+        """
+        Writes the index next to the given trace.
+        """
+        path = index_path(trace_path)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(_FILE_HEADER.pack(_MAGIC, INDEX_VERSION, self.trace_size, self.trace_mtime,
+                                          self.record_count, CHECKPOINT_INTERVAL, self.last_timestamp))
+
+                f.write(_COUNT.pack(len(self.type_offsets)))
+                for entry_type in sorted(self.type_offsets):
+                    f.write(_GROUP_HEADER.pack(entry_type, len(self.type_offsets[entry_type])))
+                    _write_array(f, self.type_offsets[entry_type])
+                    _write_array(f, self.type_state_ids[entry_type])
+
+                state_counts = [(state_id, entry_type, count)
+                                for state_id, counts in sorted(self.state_counts.items())
+                                for entry_type, count in sorted(counts.items())]
+                f.write(_COUNT.pack(len(state_counts)))
+                for state_count in state_counts:
+                    f.write(_STATE_COUNT.pack(*state_count))
+
+                f.write(_COUNT.pack(len(self.checkpoint_offsets)))
+                _write_array(f, self.checkpoint_offsets)
+                _write_array(f, self.checkpoint_timestamps)
+        except (IOError, OSError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # Replace the previous index atomically so that a concurrent reader
+        # never sees a partially written file
+        os.rename(tmp_path, path)
+
+    def _state_offsets(self, entry_type, state_ids):
+        offsets = self.type_offsets[entry_type]
+        for i, state_id in enumerate(self.type_state_ids[entry_type]):
+            if state_id in state_ids:
+                yield offsets[i]
+
+    def offsets(self, entry_types=None, state_ids=None):
+        """
+        Returns the offsets, in trace order, of the records of the given entry
+        types and/or states. All the records are selected if neither is given.
+
+        The offsets of a single type of all the states are returned as the
+        array of the index, the others as an iterator.
+        """
+        if entry_types is None:
+            entry_types = sorted(self.type_offsets)
+        else:
+            entry_types = [t for t in entry_types if t in self.type_offsets]
+
+        if state_ids is None:
+            groups = [self.type_offsets[t] for t in entry_types]
+        else:
+            state_ids = frozenset(state_ids)
+            groups = [self._state_offsets(t, state_ids) for t in entry_types]
+
+        if not groups:
+            return uint64_array()
+        if len(groups) == 1:
+            return groups[0]
+
+        return heapq.merge(*groups)
+
+    def state_record_counts(self):
+        """
+        Returns the number of records of every state, as a
+        `{state id: {entry type: count}}` dictionary.
+        """
+        return self.state_counts
+
+    def time_span(self):
+        """
+        Returns the timestamps of the first and the last records of the
+        trace, or `None` if it is empty.
+        """
+        if not self.record_count:
+            return None
+
+        return self.checkpoint_timestamps[0], self.last_timestamp
+
+
+class TraceIndexBuilder(object):
+    """
+    Collects the index of a trace while it is scanned, e.g. by
+    `S2ETraceParser.iter_entries`, which calls `add` for every record.
+    """
+
+    def __init__(self, trace_path):
+        stat = os.stat(trace_path)
+        self.trace_path = trace_path
+        self.trace_size = stat.st_size
+        self.trace_mtime = stat.st_mtime
+        self.record_count = 0
+        self.last_timestamp = 0
+        self.type_offsets = {}
+        self.type_state_ids = {}
+        self.checkpoint_offsets = uint64_array()
+        self.checkpoint_timestamps = uint64_array()
+
+    def add(self, offset, entry_type, state_id, timestamp):
+        """
+        Adds the record with the given header fields at the given offset. The
+        records must be added in trace order.
+        """
+        offsets = self.type_offsets.get(entry_type)
+        if offsets is None:
+            offsets = self.type_offsets[entry_type] = uint64_array()
+            self.type_state_ids[entry_type] = uint32_array()
+        offsets.append(offset)
+        self.type_state_ids[entry_type].append(state_id)
+
+        if not self.record_count % CHECKPOINT_INTERVAL:
+            self.checkpoint_offsets.append(offset)
+            self.checkpoint_timestamps.append(timestamp)
+        self.record_count += 1
+        self.last_timestamp = timestamp
+
+    def finish(self):
+        """
+        Returns the index of the whole trace, once all its records were
+        added, and writes it next to the trace.
+        """
+        state_counts = {}
+        for entry_type, state_ids in self.type_state_ids.items():
+            for state_id, count in Counter(state_ids).items():
+                state_counts.setdefault(state_id, {})[entry_type] = count
+
+        index = TraceIndex(self.trace_size, self.trace_mtime, self.record_count, self.last_timestamp,
+                           self.type_offsets, self.type_state_ids, state_counts, self.checkpoint_offsets,
+                           self.checkpoint_timestamps)
+        try:
+            index.save(self.trace_path)
+        except (IOError, OSError) as err:
+            print('WARN: Failed to write the trace index of %s: %s' % (self.trace_path, err))
+
+        return index